@@ -0,0 +1,205 @@
+"""
+Rolling-origin (walk-forward) backtest of the direct multi-horizon models.
+
+The last `folds` blocks of `fold_days` days are forecast one after the other, each by models trained
+only on (origin, horizon) rows whose target hour lies before the block. The feature matrix is built
+once, from the same bounded streamed sample train.py fits on, and saved to a .npy file; worker
+processes memory-map it read-only and slice it, so nothing large is pickled per fold.
+
+Each fold's fit still bins its own training rows. HistGradientBoostingRegressor has no public way to
+fit on pre-binned data, and passing it shared bin codes instead of raw values costs about as much to
+re-bin as the raw values do, so binning is repeated per fold.
+
+    python backtest.py                        # 5 folds of 30 days, all targets
+    python backtest.py --folds 10 --fold-days 14 --workers 8
+"""
+import argparse
+import json
+import os
+import pathlib
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor
+from threadpoolctl import threadpool_limits
+
+from db import from_epoch
+from instrument import traced
+from features import HORIZONS, HORIZON_FEATURES
+from verify import angular_error
+from stations import DEFAULT_STATION
+from train import TARGET_VARIABLES, MODEL_PARAMS, HORIZON_MAX_ROWS, sync_training_snapshot, sample_training_set
+
+BACKTEST_DIR = pathlib.Path(__file__).parent.parent / "backtests"
+BACKTEST_FOLDS = 5
+FOLD_DAYS = 30
+MIN_TRAIN_ROWS = 1000 # folds with less training data than this are skipped
+# Wind direction is modelled as sin/cos components and scored as the angle between forecast and observation
+WIND_COMPONENTS = ("wdir_sin", "wdir_cos")
+
+def _fit_fold(data_dir, fold, target_var, n_train, test_lo, test_hi, threads):
+    # Runs in a worker process: X and y are memory-mapped, and the training rows are a prefix slice
+    X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(data_dir, f"y_{target_var}.npy"), mmap_mode="r")
+    X_train, y_train = X[:n_train], y[:n_train]
+    valid = ~np.isnan(y_train)
+    if not valid.all():
+        X_train, y_train = X_train[valid], y_train[valid]
+    start = time.perf_counter()
+    with threadpool_limits(limits=threads, user_api="openmp"):
+        model = HistGradientBoostingRegressor(**MODEL_PARAMS)
+        model.fit(X_train, y_train)
+        preds = model.predict(X[test_lo:test_hi])
+    return fold, target_var, preds.astype(np.float32), time.perf_counter() - start
+
+def make_folds(origin_times, folds=BACKTEST_FOLDS, fold_days=FOLD_DAYS, max_horizon=max(HORIZONS)):
+    """
+    Splits rows (sorted by origin epoch seconds) into walk-forward folds over the end of the history.
+    Each fold trains on the row prefix whose targets all precede its test block.
+    """
+    fold_seconds = fold_days * 86400
+    end = int(origin_times[-1]) + 3600
+    result = []
+    for k in range(folds, 0, -1):
+        test_start = end - k * fold_seconds
+        n_train = int(np.searchsorted(origin_times, test_start - max_horizon * 3600))
+        test_lo = int(np.searchsorted(origin_times, test_start))
+        test_hi = int(np.searchsorted(origin_times, test_start + fold_seconds))
+        if n_train < MIN_TRAIN_ROWS or test_hi <= test_lo:
+            print(f"Skipping fold starting {from_epoch([test_start])[0]}: {n_train} training rows, {test_hi - test_lo} test rows")
+            continue
+        result.append({"fold": len(result), "test_start": test_start, "test_end": test_start + fold_seconds,
+                       "n_train": n_train, "test_lo": test_lo, "test_hi": test_hi})
+    return result
+
+def _errors(err, horizon, horizons):
+    # Overall and per-horizon MAE/RMSE of an error vector; NaN errors (missing observations) are ignored
+    valid = ~np.isnan(err)
+    err, horizon = err[valid], horizon[valid]
+    idx = np.searchsorted(horizons, horizon)
+    n = np.bincount(idx, minlength=len(horizons))
+    abs_sum = np.bincount(idx, weights=np.abs(err), minlength=len(horizons))
+    sq_sum = np.bincount(idx, weights=err ** 2, minlength=len(horizons))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mae_h, rmse_h = abs_sum / n, np.sqrt(sq_sum / n)
+    clean = lambda a: [None if np.isnan(v) else round(float(v), 4) for v in a]
+    return {
+        "n": int(n.sum()),
+        "mae": round(float(np.abs(err).mean()), 4) if len(err) else None,
+        "rmse": round(float(np.sqrt((err ** 2).mean())), 4) if len(err) else None,
+        "per_horizon": {"horizon": list(map(int, horizons)), "n": n.tolist(), "mae": clean(mae_h), "rmse": clean(rmse_h)},
+    }
+
+@traced("backtest")
+def backtest(station=DEFAULT_STATION.id, folds=BACKTEST_FOLDS, fold_days=FOLD_DAYS, workers=None,
+             targets=None, max_rows=HORIZON_MAX_ROWS, output=None):
+    columns, feature_names = sync_training_snapshot(station)
+    targets = [t for t in (targets or TARGET_VARIABLES) if t in columns]
+    # Streamed one snapshot partition at a time, so memory is bounded by max_rows, not the history
+    sample = sample_training_set(station, columns, feature_names, targets, max_rows=max_rows) \
+        if feature_names and targets else None
+    if sample is None:
+        print("No feature data available. Nothing to backtest.")
+        return None
+    X, y_true, target_times = sample
+    horizon = X[:, len(feature_names) + HORIZON_FEATURES.index("horizon")].astype(np.int64)
+    origin_times = target_times - horizon * 3600
+    fold_specs = make_folds(origin_times, folds, fold_days)
+    if not fold_specs:
+        print("Not enough history for any fold.")
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="weather-backtest-") as data_dir:
+        # Written once to the file the workers memory-map
+        shape = X.shape
+        np.save(os.path.join(data_dir, "X.npy"), X)
+        del X, sample
+        for target_var in targets:
+            np.save(os.path.join(data_dir, f"y_{target_var}.npy"), y_true[target_var])
+        print(f"Backtest matrix: {shape}, {len(fold_specs)} folds x {len(targets)} targets on {workers} worker(s)")
+
+        # Largest fits first, so the pool doesn't end on one long straggler
+        tasks = sorted(((f, t) for f in fold_specs for t in targets), key=lambda ft: -ft[0]["n_train"])
+        preds = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_fit_fold, data_dir, f["fold"], t, f["n_train"], f["test_lo"], f["test_hi"], threads)
+                       for f, t in tasks]
+            for future in futures:
+                fold, target_var, p, seconds = future.result()
+                preds[fold, target_var] = p
+                print(f"  fold {fold} {target_var:<9} fitted in {seconds:.1f}s")
+
+    report = _report(fold_specs, targets, preds, y_true, horizon)
+    report.update({
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "station": station,
+        "fold_days": fold_days,
+        "rows": len(origin_times),
+        "seconds": round(time.perf_counter() - started, 1),
+    })
+    _print_report(report)
+    output = pathlib.Path(output) if output else BACKTEST_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    os.makedirs(output.parent, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Saved backtest report to {output}")
+    return report
+
+def _report(fold_specs, targets, preds, y_true, horizon):
+    horizons = np.array(HORIZONS)
+    errors = {t: [] for t in targets}
+    wind = []
+    folds = []
+    for f in fold_specs:
+        test = slice(f["test_lo"], f["test_hi"])
+        for target_var in targets:
+            errors[target_var].append(preds[f["fold"], target_var] - y_true[target_var][test])
+        if all(c in targets for c in WIND_COMPONENTS):
+            sin_c, cos_c = WIND_COMPONENTS
+            wind.append(angular_error(preds[f["fold"], sin_c], preds[f["fold"], cos_c],
+                                      y_true[sin_c][test], y_true[cos_c][test]))
+        folds.append({
+            "fold": f["fold"],
+            "test_start": from_epoch([f["test_start"]])[0].isoformat(),
+            "test_end": from_epoch([f["test_end"]])[0].isoformat(),
+            "n_train": f["n_train"],
+            "n_test": f["test_hi"] - f["test_lo"],
+        })
+
+    test_horizon = np.concatenate([horizon[f["test_lo"]:f["test_hi"]] for f in fold_specs])
+    scores = {}
+    for target_var, errs in errors.items():
+        scores[target_var] = _errors(np.concatenate(errs), test_horizon, horizons)
+        scores[target_var]["per_fold"] = [
+            {k: v for k, v in _errors(e, horizon[f["test_lo"]:f["test_hi"]], horizons).items() if k != "per_horizon"}
+            for f, e in zip(fold_specs, errs)
+        ]
+    if wind:
+        scores["wdir"] = {"unit": "degrees", **_errors(np.concatenate(wind), test_horizon, horizons)}
+    return {"folds": folds, "targets": scores}
+
+def _print_report(report):
+    print(f"Backtest over {len(report['folds'])} folds ({report['folds'][0]['test_start']} .. {report['folds'][-1]['test_end']})")
+    shown = [h for h in (1, 6, 12, 24) if h in HORIZONS]
+    print(f"  {'target':<9} {'MAE':>9} {'RMSE':>9}  " + "  ".join(f"{'MAE@' + str(h) + 'h':>9}" for h in shown))
+    for target_var, s in report["targets"].items():
+        per_h = dict(zip(s["per_horizon"]["horizon"], s["per_horizon"]["mae"]))
+        fmt = lambda v: f"{v:9.4f}" if v is not None else f"{'-':>9}"
+        print(f"  {target_var:<9} {fmt(s['mae'])} {fmt(s['rmse'])}  " + "  ".join(fmt(per_h.get(h)) for h in shown))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the forecast models.")
+    parser.add_argument("--folds", type=int, default=BACKTEST_FOLDS)
+    parser.add_argument("--fold-days", type=int, default=FOLD_DAYS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--target", action="append", choices=TARGET_VARIABLES)
+    parser.add_argument("--max-rows", type=int, default=HORIZON_MAX_ROWS)
+    parser.add_argument("--station", default=DEFAULT_STATION.id)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    backtest(args.station, args.folds, args.fold_days, args.workers, args.target, args.max_rows, args.output)
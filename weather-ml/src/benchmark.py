@@ -0,0 +1,254 @@
+"""
+Offline benchmark for the fetch -> features -> train -> predict -> serve path.
+
+Each dataset size runs in a throwaway copy of the source tree (every module resolves its database,
+model and forecast paths relative to its own file), fed from synthetic hourly data through
+fetch.FileSource, so nothing touches the real database or Meteostat.
+
+    python benchmark.py                       # 1, 10 and 50 years
+    python benchmark.py --years 1 10 --requests 5000
+    python benchmark.py --compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from instrument import _rss_bytes
+
+SRC_DIR = pathlib.Path(__file__).parent
+RESULTS_DIR = SRC_DIR.parent / "benchmarks"
+DEFAULT_YEARS = [1, 10, 50]
+
+def synthetic_hourly(years, seed=0):
+    """
+    Hourly observations with daily/seasonal cycles and noise, ending at the current hour.
+    """
+    import numpy as np
+    import pandas as pd
+    from db import HOURLY_COLUMNS
+
+    end = pd.Timestamp.now(tz="UTC").floor("h") - pd.Timedelta(hours=1)
+    index = pd.date_range(end=end, periods=int(years * 8766), freq="h", name="time")
+    n = len(index)
+    rng = np.random.default_rng(seed)
+    hour = index.hour.to_numpy()
+    doy = index.dayofyear.to_numpy()
+    temp = 10 - 8 * np.cos(2 * np.pi * doy / 365.25) - 4 * np.cos(2 * np.pi * hour / 24) + rng.normal(0, 2, n)
+    df = pd.DataFrame({
+        "temp": temp,
+        "dwpt": temp - np.abs(rng.normal(3, 2, n)),
+        "rhum": np.clip(80 + rng.normal(0, 12, n), 5, 100),
+        "prcp": np.where(rng.random(n) < 0.1, rng.exponential(1.0, n), 0.0),
+        "snow": np.where(rng.random(n) < 0.01, rng.exponential(10.0, n), np.nan),
+        "wdir": rng.uniform(0, 360, n),
+        "wspd": np.abs(rng.normal(14, 6, n)),
+        "wpgt": np.abs(rng.normal(25, 8, n)),
+        "pres": 1013 + rng.normal(0, 8, n),
+        "tsun": np.where(rng.random(n) < 0.3, rng.uniform(0, 60, n), np.nan),
+        "coco": rng.integers(1, 9, n).astype(float),
+    }, index=index)
+    return df[HOURLY_COLUMNS]
+
+RSS_SAMPLE_SECONDS = 0.01
+
+class Stage:
+    """
+    Times a block and records its peak RSS and the process peak RSS at the end of the block.
+    RSS is sampled from a background thread rather than traced per allocation (tracemalloc), which
+    would slow the numpy/pandas stages down and inflate the timings.
+    """
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+
+    def _sample(self):
+        while not self._done.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self.rss_start = self.peak = _rss_bytes()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self._done.set()
+        self._sampler.join()
+        peak = max(self.peak, _rss_bytes())
+        maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            maxrss_kb /= 1024 # bytes on macOS
+        self.results[self.name] = {
+            "seconds": round(seconds, 4),
+            "rss_peak_mb": round(peak / 1e6, 1),
+            "rss_growth_mb": round((peak - self.rss_start) / 1e6, 1),
+            "max_rss_mb": round(maxrss_kb / 1024, 1),
+        }
+        print(f"  {self.name:<16} {seconds:9.3f}s  RSS peak {peak / 1e6:8.1f} MB (+{(peak - self.rss_start) / 1e6:.1f})")
+        return False
+
+def _latency_summary(latencies, wall):
+    import numpy as np
+    lat = np.asarray(latencies) * 1000
+    return {
+        "requests": len(lat),
+        "requests_per_second": round(len(lat) / wall, 1),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+    }
+
+async def _load_test(app, method, url, n_requests, concurrency, **kwargs):
+    import httpx
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(n_requests):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.text[:200]}")
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return _latency_summary(latencies, time.perf_counter() - wall_start)
+
+async def _bench_serve(n_requests, concurrency, predict_range):
+    import serve
+    results = {}
+    async with serve.lifespan(serve.app):
+        results["forecast"] = await _load_test(serve.app, "GET", "/forecast", n_requests, concurrency)
+        entry = await serve.forecast_cache.get()
+        results["forecast_304"] = await _load_test(
+            serve.app, "GET", "/forecast", n_requests, concurrency, headers={"If-None-Match": entry.etag})
+        results["predict"] = await _load_test(
+            serve.app, "POST", "/predict", max(1, n_requests // 10), concurrency,
+            json={"start": predict_range[0], "end": predict_range[1]})
+    return results
+
+def run_worker(years, n_requests, concurrency):
+    """
+    Runs every stage inside the current (temporary) source tree and returns the measurements.
+    """
+    import pandas as pd
+    import fetch
+    from features import make_features
+    from stations import DEFAULT_STATION
+    from train import train
+    from predict import make_predictions
+
+    stages = {}
+    data_dir = pathlib.Path(tempfile.mkdtemp(prefix="weather-bench-data-"))
+    df = synthetic_hourly(years)
+    df.to_csv(data_dir / f"{DEFAULT_STATION.id}.csv")
+    print(f"{years} year(s): {len(df)} hourly rows")
+
+    with Stage(stages, "ingest"):
+        # fetch_and_store also updates the feature store and its columnar snapshot
+        fetch.fetch_and_store([DEFAULT_STATION], source=fetch.FileSource(data_dir))
+    with Stage(stages, "make_features"):
+        make_features(df)
+    with Stage(stages, "train"):
+        train()
+    with Stage(stages, "predict"):
+        make_predictions()
+
+    # /predict forecasts from each of the last 24 stored hours
+    predict_range = (df.index[-24].isoformat(), df.index[-1].isoformat())
+    serve_results = asyncio.run(_bench_serve(n_requests, concurrency, predict_range))
+    for name, summary in serve_results.items():
+        print(f"  serve {name:<12} {summary['requests_per_second']:9.1f} req/s  p99 {summary['p99_ms']:.3f} ms")
+
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return {"rows": len(df), "stages": stages, "serve": serve_results}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_all(years_list, n_requests, concurrency, output=None):
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": {},
+    }
+    for years in years_list:
+        # Fresh tree per size, so each run starts from an empty database and no models
+        with tempfile.TemporaryDirectory(prefix="weather-bench-") as tmp:
+            tree = pathlib.Path(tmp) / "weather-ml"
+            shutil.copytree(SRC_DIR, tree / "src", ignore=shutil.ignore_patterns(
+                "__pycache__", "models", "forecast_24h.*"))
+            (tree / "data").mkdir()
+            result_file = pathlib.Path(tmp) / "result.json"
+            subprocess.run(
+                [sys.executable, "benchmark.py", "--worker", "--years", str(years), "--requests", str(n_requests),
+                 "--concurrency", str(concurrency), "--output", str(result_file)],
+                cwd=tree / "src", check=True,
+            )
+            report["results"][str(years)] = json.loads(result_file.read_text())
+
+    output = pathlib.Path(output) if output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    os.makedirs(output.parent, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Saved benchmark results to {output}")
+    return report
+
+def compare(old_path, new_path):
+    old = json.loads(pathlib.Path(old_path).read_text())
+    new = json.loads(pathlib.Path(new_path).read_text())
+    print(f"{old['commit']} -> {new['commit']}")
+    for years in sorted(set(old["results"]) & set(new["results"]), key=float):
+        print(f"\n{years} year(s)")
+        o, n = old["results"][years], new["results"][years]
+        for stage in n["stages"]:
+            if stage in o["stages"]:
+                a, b = o["stages"][stage]["seconds"], n["stages"][stage]["seconds"]
+                print(f"  {stage:<16} {a:9.3f}s -> {b:9.3f}s  ({b / a if a else float('nan'):5.2f}x)")
+        for name in n["serve"]:
+            if name in o["serve"]:
+                a, b = o["serve"][name]["p99_ms"], n["serve"][name]["p99_ms"]
+                print(f"  serve {name:<10} p99 {a:8.3f}ms -> {b:8.3f}ms  ({b / a if a else float('nan'):5.2f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the weather pipeline on synthetic data.")
+    parser.add_argument("--years", type=float, nargs="+", default=DEFAULT_YEARS)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per serve load test")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.worker:
+        result = run_worker(args.years[0], args.requests, args.concurrency)
+        pathlib.Path(args.output).write_text(json.dumps(result))
+    else:
+        run_all(args.years, args.requests, args.concurrency, args.output)
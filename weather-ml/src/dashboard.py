@@ -1,16 +1,38 @@
+import json
+import os
+import threading
+import time
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
+import flask
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go # Added for more control if needed, though px might suffice
 import numpy as np
-import json # Added for json.JSONDecodeError handling in callback
+import pyarrow as pa
 
 # FastAPI server URL
 API_URL = "http://127.0.0.1:8008/forecast"
+# Server-Sent Events stream announcing new forecasts. The browser reads it through this dashboard's
+# own /events route (see relay_events), so it works wherever the dashboard is served from.
+EVENTS_URL = "http://127.0.0.1:8008/events"
+# The API sends a keepalive every 15 s; a relayed stream silent for longer than this is reconnected
+EVENTS_READ_TIMEOUT = 60
+EVENTS_RETRY_MS = 2000
+# Sessions also revalidate the forecast this often, in case events are not getting through
+FALLBACK_REFRESH_SECONDS = float(os.environ.get("FALLBACK_REFRESH_SECONDS", "300"))
+# The columnar Arrow forecast loads straight into a DataFrame; JSON is accepted from older API versions
+ACCEPT = "application/vnd.apache.arrow.file, application/json;q=0.5"
+REQUEST_TIMEOUT = (3.05, 10) # (connect, read) seconds
+
+# One pooled session for the whole process, so API calls reuse keep-alive connections
+http = requests.Session()
+http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
 
 # Initialize Dash app with Bootstrap theme
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
@@ -18,7 +40,8 @@ app.title = "Weather Forecast Dashboard"
 
 # App layout
 app.layout = dbc.Container([
-    dbc.Row(dbc.Col(html.H1("Drenthe Weather Forecast", className="text-center my-4"), width=12)),
+    dbc.Row(dbc.Col(html.H1("Drenthe Weather Forecast", className="text-center mt-4"), width=12)),
+    dbc.Row(dbc.Col(html.Div(id='events-status', className="text-center text-muted small mb-3"), width=12)),
     dbc.Row([
         dbc.Col(dcc.Graph(id='temp-graph'), width=12, md=4),
         dbc.Col(dcc.Graph(id='rhum-graph'), width=12, md=4),
@@ -29,61 +52,109 @@ app.layout = dbc.Container([
         dbc.Col(dcc.Graph(id='prcp-graph'), width=12, md=4),
         # Optional: dbc.Col(width=12, md=4) # Add an empty column if you want to ensure the row structure is always 3-wide for alignment
     ]),
-    dcc.Interval(
-        id='interval-component',
-        interval=5*60*1000,  # in milliseconds
-        n_intervals=0
-    )
+    # Forecast version (ETag) this browser session is showing
+    dcc.Store(id='forecast-version'),
+    # Latest event from the API's /events stream, {"version": ...}; set in the browser by the EventSource below
+    dcc.Store(id='forecast-event'),
+    # Slow fallback for when the event stream is down
+    dcc.Interval(id='fallback-refresh', interval=int(FALLBACK_REFRESH_SECONDS * 1000)),
 ], fluid=True)
 
-# Helper function to convert degrees to cardinal directions
-def degrees_to_cardinal(d):
-    if pd.isna(d):
-        return "N/A"
-    dirs = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
-    ix = int(round(d / (360. / len(dirs))))
-    return dirs[ix % len(dirs)]
+@app.server.route(f"{app.config.routes_pathname_prefix}events")
+def relay_events():
+    """
+    Relays the API's /events stream, so the browser's EventSource stays on the dashboard's origin.
+    If the API can't be reached the stream ends right away; the EventSource then reconnects after
+    EVENTS_RETRY_MS (an error status would make it give up instead).
+    """
+    headers = {"Accept": "text/event-stream"}
+    if flask.request.headers.get("Last-Event-ID"):
+        headers["Last-Event-ID"] = flask.request.headers["Last-Event-ID"]
+    try:
+        upstream = requests.get(EVENTS_URL, headers=headers, stream=True, timeout=(REQUEST_TIMEOUT[0], EVENTS_READ_TIMEOUT))
+        upstream.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error connecting to the API's event stream: {e}")
+        upstream = None
 
-# Callback to update graphs
-@app.callback(
-    [Output('temp-graph', 'figure'),
-     Output('rhum-graph', 'figure'),
-     Output('wspd-graph', 'figure'),
-     Output('prcp-graph', 'figure'),
-     Output('wdir-graph', 'figure')],
-    [Input('interval-component', 'n_intervals')]
+    def stream():
+        if upstream is None:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n"
+            return
+        try:
+            for chunk in upstream.iter_content(chunk_size=None):
+                yield chunk
+        except requests.exceptions.RequestException:
+            pass
+        finally:
+            upstream.close()
+    return flask.Response(stream(), mimetype="text/event-stream",
+                          headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# The graphs are refreshed when the API announces a new forecast (and on the slow fallback interval).
+# The EventSource reconnects by itself after the API restarts and is sent the current version on every
+# (re)connect.
+app.clientside_callback(
+    """
+    function(id) {
+        if (!window.forecastEvents) {
+            const source = new EventSource(%s);
+            source.addEventListener("forecast", (e) => {
+                dash_clientside.set_props("forecast-event", {data: JSON.parse(e.data)});
+            });
+            source.onopen = () => dash_clientside.set_props("events-status", {children: "Live updates"});
+            source.onerror = () => dash_clientside.set_props("events-status", {children: "Reconnecting to the forecast API..."});
+            window.forecastEvents = source;
+        }
+        return "Connecting...";
+    }
+    """ % json.dumps(app.get_relative_path("/events")),
+    Output('events-status', 'children'),
+    Input('forecast-event', 'id'),
 )
-def update_graphs(n_intervals):
-    empty_fig_layout_spec = {"layout": {"xaxis": {"visible": False}, "yaxis": {"visible": False}, "annotations": [{"xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 20}}]}}
-    
-    def create_error_fig(message):
-        spec = dict(empty_fig_layout_spec) # Create a copy
-        spec["layout"]["annotations"][0]["text"] = message
-        return spec
 
-    try:
-        response = requests.get(API_URL)
-        response.raise_for_status()
-        forecast_data = response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from API: {e}")
-        err_fig = create_error_fig("No data: API error")
-        return err_fig, err_fig, err_fig, err_fig, err_fig
-    except json.JSONDecodeError:
-        print("Error decoding JSON from API")
-        err_fig = create_error_fig("Error decoding API data")
-        return err_fig, err_fig, err_fig, err_fig, err_fig
+# Helper function to convert degrees to cardinal directions, for a whole column at once
+CARDINAL_DIRS = np.array(['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW', 'N/A'])
+
+def degrees_to_cardinal(d):
+    d = np.asarray(d, dtype=float)
+    missing = np.isnan(d)
+    ix = np.rint(np.where(missing, 0, d) / (360. / 16)).astype(int) % 16
+    return CARDINAL_DIRS[np.where(missing, 16, ix)]
 
+def create_error_fig(message):
+    return {"layout": {"xaxis": {"visible": False}, "yaxis": {"visible": False}, "annotations": [{"xref": "paper", "yref": "paper", "showarrow": False, "font": {"size": 20}, "text": message}]}}
+
+def error_figs(message):
+    err_fig = create_error_fig(message)
+    return err_fig, err_fig, err_fig, err_fig, err_fig
+
+def forecast_frame(response):
+    """
+    Forecast DataFrame indexed by (naive UTC) time from an Arrow or JSON API response; None if it is empty.
+    """
+    if response.headers.get("Content-Type", "").startswith("application/vnd.apache.arrow"):
+        df = pa.ipc.open_file(pa.py_buffer(response.content)).read_pandas(split_blocks=True)
+        df.index = pd.DatetimeIndex(df.pop("time")).tz_localize(None)
+        return df if not df.empty else None
+    forecast_data = response.json()
     if not forecast_data or isinstance(forecast_data, dict) and forecast_data.get("message") == "Forecast data is currently empty or not available.":
+        return None
+    df = pd.DataFrame.from_dict(forecast_data, orient='index')
+    if df.empty: # Check if DataFrame is empty after from_dict before accessing index
+         raise ValueError("DataFrame is empty after from_dict, before to_datetime conversion.")
+    df.index = pd.to_datetime(df.index)
+    return df
+
+def build_figures(df):
+    """
+    Builds the five forecast figures as plain dicts (temp, rhum, wspd, prcp, wdir).
+    """
+    if df is None:
         print("Forecast data is empty or not available from API.")
-        err_fig = create_error_fig("Forecast data not available")
-        return err_fig, err_fig, err_fig, err_fig, err_fig
+        return error_figs("Forecast data not available")
 
     try:
-        df = pd.DataFrame.from_dict(forecast_data, orient='index')
-        if df.empty: # Check if DataFrame is empty after from_dict before accessing index
-             raise ValueError("DataFrame is empty after from_dict, before to_datetime conversion.")
-        df.index = pd.to_datetime(df.index)
         df = df.sort_index()
 
         if df.empty:
@@ -94,7 +165,7 @@ def update_graphs(n_intervals):
         else:
             df['wdir_deg'] = np.nan
         
-        df['wdir_cardinal'] = df['wdir_deg'].apply(degrees_to_cardinal)
+        df['wdir_cardinal'] = degrees_to_cardinal(df['wdir_deg'])
 
         fig_temp = px.line(df, x=df.index, y='temp', title='Temperature Forecast (°C)', markers=True)
         fig_rhum = px.line(df, x=df.index, y='rhum', title='Relative Humidity Forecast (%)', markers=True)
@@ -139,12 +210,94 @@ def update_graphs(n_intervals):
             ]
         )
         
-        return fig_temp, fig_rhum, fig_wspd, fig_prcp, fig_wdir
+        # Plain dicts are built once and reused for every session that asks for this version
+        return tuple(fig.to_plotly_json() for fig in (fig_temp, fig_rhum, fig_wspd, fig_prcp, fig_wdir))
         
     except Exception as e:
         print(f"Error processing data or creating figures: {e}")
-        err_fig = create_error_fig(f"Error: {str(e)[:100]}")
-        return err_fig, err_fig, err_fig, err_fig, err_fig
+        return error_figs(f"Error: {str(e)[:100]}")
+
+class FigureCache:
+    """
+    Process-wide cache of the figures for the latest forecast version, shared by all sessions.
+    The API is only asked again (with If-None-Match) when a session reports an event with a version
+    not seen before, or when the last check is older than the fallback interval, so one forecast
+    update costs one request however many sessions are open. Figures are only rebuilt when the API
+    returns a new ETag.
+    """
+    def __init__(self, url):
+        self.url = url
+        self.version = None   # ETag of the forecast the figures were built from
+        self.figures = None
+        self.event_version = None # latest version announced by /events that was acted on
+        self.checked_at = None    # time.monotonic() of the last request to the API
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        # True if the API answered with a forecast (new, unchanged or absent), False on errors
+        self.checked_at = time.monotonic()
+        headers = {"Accept": ACCEPT}
+        if self.version and self.figures is not None:
+            headers["If-None-Match"] = self.version
+        try:
+            response = http.get(self.url, headers=headers, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 304:
+                return True
+            if response.status_code == 404:
+                # No forecast could be made (the Arrow file is removed along with it)
+                self.version, self.figures = None, build_figures(None)
+                return True
+            response.raise_for_status()
+            df = forecast_frame(response)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching data from API: {e}")
+            if self.figures is None:
+                self.version, self.figures = None, error_figs("No data: API error")
+            return False
+        except (ValueError, pa.ArrowInvalid):
+            print("Error decoding forecast data from API")
+            if self.figures is None:
+                self.version, self.figures = None, error_figs("Error decoding API data")
+            return False
+        # Without an ETag the body is the only way to tell versions apart
+        version = response.headers.get("ETag") or str(hash(response.content))
+        if version != self.version or self.figures is None:
+            self.figures = build_figures(df)
+            self.version = version
+        return True
+
+    def get(self, event=None, max_age=None):
+        # Sessions arriving while another one revalidates wait for it instead of calling the API themselves
+        with self._lock:
+            announced = event is not None and event.get("version") != self.event_version
+            stale = max_age is not None and (self.checked_at is None or time.monotonic() - self.checked_at >= max_age)
+            if announced or stale or self.figures is None:
+                # An event is only marked as handled once its forecast was fetched, so a failed
+                # refresh is tried again by the next session or fallback tick
+                if self._refresh() and event is not None:
+                    self.event_version = event.get("version")
+            return self.version, self.figures
+
+figure_cache = FigureCache(API_URL)
+
+# Callback to update graphs
+@app.callback(
+    [Output('temp-graph', 'figure'),
+     Output('rhum-graph', 'figure'),
+     Output('wspd-graph', 'figure'),
+     Output('prcp-graph', 'figure'),
+     Output('wdir-graph', 'figure'),
+     Output('forecast-version', 'data')],
+    [Input('forecast-event', 'data'),
+     Input('fallback-refresh', 'n_intervals')],
+    [State('forecast-version', 'data')]
+)
+def update_graphs(event, _, shown_version):
+    version, figures = figure_cache.get(event, max_age=FALLBACK_REFRESH_SECONDS)
+    if version is not None and version == shown_version:
+        # This session already shows the current forecast: nothing to send
+        return (dash.no_update,) * 6
+    return (*figures, version)
 
 # To run this Dash application:
 # 1. Ensure your FastAPI server (serve.py) is running on http://127.0.0.1:8000
@@ -0,0 +1,113 @@
+import sqlite3
+import pandas as pd
+from stations import DEFAULT_STATION
+
+# Columns returned by meteostat's Hourly, in storage order
+HOURLY_COLUMNS = ['temp', 'dwpt', 'rhum', 'prcp', 'snow', 'wdir', 'wspd', 'wpgt', 'pres', 'tsun', 'coco']
+
+# time is stored as integer seconds since the epoch (UTC). (station, time) is the primary key, so
+# re-fetched hours replace the stored row instead of duplicating it, and per-station MAX(time) or
+# latest-window reads are index lookups rather than table scans.
+HOURLY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS hourly (
+    station TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    {", ".join(f"{c} REAL" for c in HOURLY_COLUMNS)},
+    PRIMARY KEY (station, time)
+) WITHOUT ROWID
+"""
+
+def connect(path, check_same_thread=True):
+    """
+    Opens the weather database in WAL mode, so the API and batch jobs can keep reading while ingest writes.
+    """
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+    return row is not None
+
+def table_columns(conn, name):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({name})")]
+
+def _is_current_hourly(conn):
+    info = {r[1]: (r[2].upper(), r[5]) for r in conn.execute("PRAGMA table_info(hourly)")}
+    return info.get("time") == ("INTEGER", 2) and info.get("station", (None, 0))[1] == 1
+
+def _migrate_hourly(conn):
+    # Tables written by older versions have text timestamps ("YYYY-MM-DD HH:MM:SS+00:00"), no key and
+    # possibly duplicated hours, and may predate the station column. Copy them into the keyed schema;
+    # for duplicated hours the most recently inserted row wins, as it would with an upsert.
+    legacy_cols = table_columns(conn, "hourly")
+    station_expr = "station" if "station" in legacy_cols else f"'{DEFAULT_STATION.id}'"
+    value_exprs = ", ".join(c if c in legacy_cols else "NULL" for c in HOURLY_COLUMNS)
+    count = conn.execute("SELECT COUNT(*) FROM hourly").fetchone()[0]
+    print(f"Migrating hourly table ({count} rows) to the keyed integer-time schema...")
+    with conn:
+        conn.execute("ALTER TABLE hourly RENAME TO hourly_legacy")
+        conn.execute(HOURLY_SCHEMA)
+        conn.execute(f"""
+            INSERT INTO hourly (station, time, {", ".join(HOURLY_COLUMNS)})
+            SELECT {station_expr}, CAST(strftime('%s', time) AS INTEGER), {value_exprs}
+            FROM hourly_legacy WHERE time IS NOT NULL ORDER BY rowid
+            ON CONFLICT (station, time) DO UPDATE SET {_update_set(HOURLY_COLUMNS)}
+        """)
+        conn.execute("DROP TABLE hourly_legacy")
+        # Derived tables were keyed on the old text timestamps; they are rebuilt from hourly
+        conn.execute("DROP TABLE IF EXISTS features")
+    migrated = conn.execute("SELECT COUNT(*) FROM hourly").fetchone()[0]
+    print(f"Migration done: {migrated} rows ({count - migrated} duplicate or invalid rows dropped).")
+
+def ensure_hourly_table(conn):
+    """
+    Creates the hourly table, migrating a table written by older versions once if needed.
+    """
+    if table_exists(conn, "hourly") and not _is_current_hourly(conn):
+        _migrate_hourly(conn)
+    conn.execute(HOURLY_SCHEMA)
+    conn.commit()
+
+def to_epoch(index):
+    # UTC DatetimeIndex -> integer seconds since the epoch
+    return pd.DatetimeIndex(index).as_unit("s").asi8
+
+def from_epoch(values) -> pd.DatetimeIndex:
+    return pd.to_datetime(values, unit="s", utc=True)
+
+def time_key(ts):
+    ts = pd.Timestamp(ts)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return int(ts.timestamp())
+
+def last_time(conn, station_id):
+    if not table_exists(conn, "hourly"):
+        return None
+    last = conn.execute("SELECT MAX(time) FROM hourly WHERE station = ?", (station_id,)).fetchone()[0]
+    return None if last is None else pd.Timestamp(last, unit="s", tz="UTC")
+
+def _update_set(columns):
+    return ", ".join(f'"{c}" = excluded."{c}"' for c in columns)
+
+def upsert_rows(conn, table, station_id, df, columns):
+    """
+    Bulk-upserts one station's rows into a (station, time)-keyed table with a single executemany.
+    `df` must have a UTC DatetimeIndex. Returns the number of rows written.
+    """
+    values = df.reindex(columns=columns).astype(object)
+    values = values.where(values.notna(), None)
+    times = to_epoch(df.index).tolist()
+    rows = [(station_id, t, *v) for t, v in zip(times, values.itertuples(index=False, name=None))]
+    col_list = ", ".join(f'"{c}"' for c in columns)
+    placeholders = ", ".join("?" * (len(columns) + 2))
+    conn.executemany(
+        f"INSERT INTO {table} (station, time, {col_list}) VALUES ({placeholders}) "
+        f"ON CONFLICT (station, time) DO UPDATE SET {_update_set(columns)}",
+        rows,
+    )
+    return len(rows)
+
+def upsert_hourly(conn, station_id, df):
+    return upsert_rows(conn, "hourly", station_id, df, HOURLY_COLUMNS)
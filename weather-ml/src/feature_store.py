@@ -0,0 +1,145 @@
+import os
+import pandas as pd
+from features import make_features, FEATURE_CONTEXT
+from db import table_exists, table_columns, ensure_hourly_table, upsert_rows, time_key, from_epoch
+from stations import DEFAULT_STATION
+from instrument import span, traced
+
+FEATURE_TABLE = "features"
+# Hourly rows featurized at once. Long histories (a first build, a backfill) are processed in
+# time-ordered chunks of this size, so memory depends on it rather than on the length of the history.
+FEATURE_CHUNK_ROWS = int(os.environ.get("FEATURE_CHUNK_ROWS", "50000"))
+
+def _read_hourly(conn, station_id, where="", params=(), order="ASC", limit=None):
+    query = f"SELECT * FROM hourly WHERE station = ? {where} ORDER BY time {order}"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    df = pd.read_sql(query, conn, params=(station_id, *params), index_col="time")
+    df = df.drop(columns=["station"])
+    df.index = from_epoch(df.index)
+    if order == "DESC":
+        df = df.iloc[::-1]
+    return df
+
+def _create_feature_table(conn, feature_columns):
+    cols = ", ".join(f'"{c}" REAL' for c in feature_columns)
+    conn.execute(f"""
+        CREATE TABLE {FEATURE_TABLE} (
+            station TEXT NOT NULL,
+            time INTEGER NOT NULL,
+            {cols},
+            PRIMARY KEY (station, time)
+        ) WITHOUT ROWID
+    """)
+
+def _update_station(conn, station_id, chunk_rows=FEATURE_CHUNK_ROWS):
+    last = conn.execute(f"SELECT MAX(time) FROM {FEATURE_TABLE} WHERE station = ?", (station_id,)).fetchone()[0]
+
+    # Lags and rolling windows never cross stations: each station is its own time series.
+    # Each chunk is preceded by the FEATURE_CONTEXT rows before it, so chunking gives the same features
+    # up to the rounding of pandas' running rolling sums (~1e-14), as appending new hours already does.
+    if last is None:
+        df_context = None
+    else:
+        df_context = _read_hourly(conn, station_id, "AND time <= ?", (last,), order="DESC", limit=FEATURE_CONTEXT)
+    appended = 0
+    while True:
+        with span("features.read_hourly", station=station_id) as record:
+            if last is None:
+                df_new = _read_hourly(conn, station_id, limit=chunk_rows)
+            else:
+                df_new = _read_hourly(conn, station_id, "AND time > ?", (last,), limit=chunk_rows)
+            record["rows"] = len(df_new)
+        if df_new.empty:
+            break
+        if df_context is None:
+            df_context = df_new.iloc[:0]
+
+        with span("features.build", station=station_id, rows=len(df_new)):
+            out = make_features(pd.concat([df_context, df_new])).iloc[len(df_context):]
+        with span("features.upsert", station=station_id, rows=len(out)):
+            appended += upsert_rows(conn, FEATURE_TABLE, station_id, out, list(out.columns))
+
+        if len(df_new) < chunk_rows:
+            break
+        df_context = pd.concat([df_context, df_new]).iloc[-FEATURE_CONTEXT:]
+        last = time_key(df_new.index[-1])
+    return appended
+
+def invalidate_features(conn, station_id, since):
+    """
+    Drops stored features from `since` onwards, e.g. after hourly rows at or before the feature
+    watermark were inserted or corrected. The next update recomputes them from that point.
+    """
+    if table_exists(conn, FEATURE_TABLE):
+        conn.execute(f"DELETE FROM {FEATURE_TABLE} WHERE station = ? AND time >= ?", (station_id, time_key(since)))
+
+@traced("features")
+def update_feature_store(conn, stations=None, rebuild=False) -> int:
+    """
+    Computes features for hourly rows that are not yet in the feature table and appends them.
+    Only FEATURE_CONTEXT preceding rows per station are re-read to seed the LAGS/ROLLS windows,
+    so the cost depends on the number of new rows, not on the length of the history.
+    `rebuild` recomputes every row, e.g. after the feature code changed. Returns the number of rows appended.
+    """
+    if not table_exists(conn, "hourly"):
+        print("No hourly table found. Feature store not updated.")
+        return 0
+    ensure_hourly_table(conn)
+
+    if stations is None:
+        stations = [r[0] for r in conn.execute("SELECT DISTINCT station FROM hourly")]
+    if not stations:
+        print("Feature store is up to date.")
+        return 0
+
+    # If hourly gained or lost columns the stored features no longer line up: rebuild from scratch
+    feature_columns = list(make_features(_read_hourly(conn, stations[0], limit=1)).columns)
+    if table_exists(conn, FEATURE_TABLE) and table_columns(conn, FEATURE_TABLE) != ["station", "time"] + feature_columns:
+        print("Feature table schema is out of date. Rebuilding the feature store.")
+        conn.execute(f"DROP TABLE {FEATURE_TABLE}")
+    elif rebuild and table_exists(conn, FEATURE_TABLE):
+        print("Rebuilding the feature store.")
+        conn.execute(f"DROP TABLE {FEATURE_TABLE}")
+    if not table_exists(conn, FEATURE_TABLE):
+        _create_feature_table(conn, feature_columns)
+
+    appended = 0
+    for station_id in stations:
+        appended += _update_station(conn, station_id)
+    conn.commit()
+
+    if appended:
+        print(f"Appended {appended} rows to the feature store.")
+    else:
+        print("Feature store is up to date.")
+    return appended
+
+def load_features(conn, station=DEFAULT_STATION.id, columns=None, limit=None, start=None, end=None) -> pd.DataFrame:
+    """
+    Reads one station's features in ascending time order. `limit` returns only the most recent rows;
+    `start`/`end` (inclusive, UTC) restrict the time range.
+    """
+    select = "*" if columns is None else ", ".join(["time"] + [f'"{c}"' for c in columns])
+    clauses, params = ["station = ?"], [station]
+    if start is not None:
+        clauses.append("time >= ?")
+        params.append(time_key(start))
+    if end is not None:
+        clauses.append("time <= ?")
+        params.append(time_key(end))
+    where = f"WHERE {' AND '.join(clauses)}"
+    if limit is None:
+        query = f"SELECT {select} FROM {FEATURE_TABLE} {where} ORDER BY time"
+    else:
+        # Walks the (station, time) key backwards, so the latest window costs O(log n + limit)
+        query = f"SELECT {select} FROM {FEATURE_TABLE} {where} ORDER BY time DESC LIMIT {int(limit)}"
+    with span("features.load", station=station) as record:
+        df = pd.read_sql(query, conn, params=params, index_col="time")
+        record["rows"] = len(df)
+    if limit is not None:
+        df = df.iloc[::-1]
+    df = df.drop(columns=["station"], errors="ignore")
+    df.index = from_epoch(df.index)
+    # Columns that are entirely NULL come back as object dtype; features are always numeric
+    return df.astype("float64")
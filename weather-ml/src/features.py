@@ -7,6 +7,8 @@ ROLLS = [(6, "mean"), (24, "mean")]
 SIMPLE_FEATURE_VARS = ['temp', 'rhum', 'prcp', 'wspd']
 # Cyclical encoding for time features remains
 CYCLICAL_TIME = ["hour", "dayofyear"]
+# Number of preceding rows a new row needs to reproduce its lag/roll features exactly
+FEATURE_CONTEXT = max(LAGS + [win for win, _ in ROLLS])
 
 def make_features(df: pd.DataFrame) -> pd.DataFrame:
     out = df.copy()
@@ -54,4 +56,42 @@ def make_features(df: pd.DataFrame) -> pd.DataFrame:
     
     # The .dropna() was removed previously; HistGradientBoostingRegressor handles NaNs in features.
     # However, target variables will need NaNs removed before training each specific model.
-    return out 
\ No newline at end of file
+    return out 
+
+# --- Direct multi-horizon forecasting ---
+# One model per target covers every lead time: each training row pairs the features observed at an
+# origin hour with a horizon h and the target value h hours later.
+HORIZONS = list(range(1, 25))  # h ahead
+# Appended after the origin features, in this order
+HORIZON_FEATURES = ["horizon", "valid_hour_sin", "valid_hour_cos", "valid_doy_sin", "valid_doy_cos"]
+
+def horizon_features(origin_times: pd.DatetimeIndex, horizons) -> np.ndarray:
+    # Horizon plus the cyclical encoding of the hour being forecast (not the origin hour)
+    horizons = np.asarray(horizons)
+    valid = origin_times + pd.to_timedelta(horizons, unit="h")
+    return np.column_stack([
+        horizons,
+        np.sin(2 * np.pi * valid.hour / 24.0),
+        np.cos(2 * np.pi * valid.hour / 24.0),
+        np.sin(2 * np.pi * valid.dayofyear / 365.25),
+        np.cos(2 * np.pi * valid.dayofyear / 365.25),
+    ]).astype(np.float32)
+
+def make_horizon_matrix(df_origin: pd.DataFrame, feature_names, horizons=HORIZONS):
+    """
+    Builds the design matrix for forecasting every horizon from every row of df_origin in one go:
+    rows are (origin, horizon) pairs with origins outer and horizons inner.
+    Returns the float32 matrix and the valid time of each row.
+    """
+    origin_names = list(feature_names[:-len(HORIZON_FEATURES)])
+    if list(feature_names[-len(HORIZON_FEATURES):]) != HORIZON_FEATURES:
+        raise ValueError("feature_names must end with HORIZON_FEATURES")
+    n_h = len(horizons)
+    X = np.empty((len(df_origin) * n_h, len(feature_names)), dtype=np.float32)
+    # Columns the caller did not supply become NaN, which the models treat as missing values
+    X[:, :len(origin_names)] = np.repeat(df_origin.reindex(columns=origin_names).to_numpy(dtype=np.float32), n_h, axis=0)
+    origin_times = df_origin.index.repeat(n_h)
+    horizon_col = np.tile(np.asarray(horizons), len(df_origin))
+    X[:, len(origin_names):] = horizon_features(origin_times, horizon_col)
+    valid_times = origin_times + pd.to_timedelta(horizon_col, unit="h")
+    return X, valid_times
@@ -1,49 +1,243 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone
+import argparse
+import os
 import pandas as pd
-from meteostat import Point, Hourly
-import sqlite3, pathlib
+import pathlib
+import random
+import time
+import warnings
+from db import connect, ensure_hourly_table, upsert_hourly, last_time, time_key, from_epoch
+from feature_store import update_feature_store, invalidate_features
+from snapshot import sync_snapshot
+from rollups import update_rollups, ensure_rollups
+from stations import load_stations
+from instrument import span, traced
 
-POINT = Point(53.06, 6.66)  # Zeegse
 DB = pathlib.Path(__file__).parent.parent / "weather.sqlite"
+HISTORY_START = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
-def fetch_and_store():
-    # 1. figure out last timestamp we already have
-    conn = sqlite3.connect(DB)
-    try:
-        last = pd.read_sql("SELECT MAX(time) AS t FROM hourly", conn)["t"][0]
-        start = pd.to_datetime(last, utc=True) + pd.Timedelta(hours=1)
-    except Exception:
-        start = datetime(1970, 1, 1, tzinfo=timezone.utc)
-    end = datetime.now(timezone.utc)
+# Upper bound on concurrent downloads (stations or backfill chunks). Results are written as they
+# arrive and no more downloads are in flight than this, so memory holds at most one chunk per worker.
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "8"))
+# Failed downloads are retried with exponential backoff: FETCH_BACKOFF_SECONDS, then twice that, ...
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", "3"))
+FETCH_BACKOFF_SECONDS = float(os.environ.get("FETCH_BACKOFF_SECONDS", "2"))
 
-    # 2. grab data
-    if start >= end:
-        print("Data is up to date. No new data to fetch.")
-        return
+# A station without any stored hours is backfilled from HISTORY_START in per-year chunks. The plan is
+# recorded here first and each chunk is marked done in the same transaction that stores its rows,
+# so an interrupted backfill resumes with the chunks that are still missing.
+BACKFILL_TABLE = "backfill_chunks"
+BACKFILL_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {BACKFILL_TABLE} (
+    station TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    rows INTEGER,
+    completed_at TEXT,
+    PRIMARY KEY (station, start)
+) WITHOUT ROWID
+"""
 
-    # For the Hourly call, provide naive UTC datetimes as the library seems to mix naive/aware internally
-    # The actual start and end times remain timezone-aware UTC for our logic.
-    start_for_hourly = start.replace(tzinfo=None)
-    end_for_hourly = end.replace(tzinfo=None)
+class MeteostatSource:
+    """
+    Hourly observations from the Meteostat API.
+    """
+    def fetch(self, station, start, end):
+        # Imported here so offline runs with FileSource don't need the meteostat package
+        from meteostat import Point, Hourly
+        # Meteostat turns a failed download (HTTP 5xx, 429, ...) into a "Cannot load" warning and an
+        # empty frame, which would be stored as a finished chunk with no rows. Raise it instead, so
+        # _fetch_station retries it and an unfinished chunk stays open. This is a filter on that message
+        # only, not catch_warnings: that swaps process-wide state and downloads run in parallel threads.
+        warnings.filterwarnings("error", message="Cannot load ", module="meteostat")
+        # For the Hourly call, provide naive UTC datetimes as the library seems to mix naive/aware internally
+        # The actual start and end times remain timezone-aware UTC for our logic.
+        return Hourly(Point(station.lat, station.lon), start.replace(tzinfo=None), end.replace(tzinfo=None)).fetch()
 
-    print(f"Fetching data from {start.strftime('%Y-%m-%d %H:%M:%S %Z')} to {end.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-    df = Hourly(POINT, start_for_hourly, end_for_hourly).fetch()
+class FileSource:
+    """
+    Local stand-in for Meteostat: reads <directory>/<station id>.csv with a `time` column
+    plus the hourly variables. Useful for offline runs and ingestion throughput tests.
+    """
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
 
-    if df.empty:
-        print("Fetched data is empty. Nothing to persist.")
-        conn.close()
-        return
+    def fetch(self, station, start, end):
+        path = self.directory / f"{station.id}.csv"
+        if not path.exists():
+            return pd.DataFrame()
+        df = pd.read_csv(path, index_col="time")
+        df.index = pd.to_datetime(df.index, utc=True)
+        return df[(df.index >= start) & (df.index <= end)]
 
-    # 3. persist
+def _fetch_station(source, station, start, end):
+    # Retried with exponential backoff (plus jitter, so parallel chunks don't retry in lockstep)
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            with span("fetch.download", station=station.id, start=start, attempt=attempt) as record:
+                df = source.fetch(station, start, end)
+                record["rows"] = len(df)
+            break
+        except Exception as e:
+            if attempt == FETCH_RETRIES:
+                raise
+            delay = FETCH_BACKOFF_SECONDS * 2 ** attempt * (1 + random.random() / 2)
+            print(f"[{station.id}] Fetch from {start:%Y-%m-%d} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+    if df.empty:
+        return df
     # Ensure the DataFrame index is timezone-aware (UTC) before saving if it's not already
     if df.index.tz is None:
         df.index = df.index.tz_localize('UTC', ambiguous='infer') # be careful with ambiguous times if any
     else:
         df.index = df.index.tz_convert('UTC')
-        
-    df.to_sql("hourly", conn, if_exists="append", index_label="time")
-    print(f"Appended {len(df)} new rows to the database.")
+    return df
+
+def year_chunks(start, end):
+    """
+    Splits [start, end] into per-calendar-year (start, end) pairs, both ends inclusive at hourly resolution.
+    """
+    chunks = []
+    while start <= end:
+        next_year = datetime(start.year + 1, 1, 1, tzinfo=timezone.utc)
+        chunks.append((start, min(end, next_year - pd.Timedelta(hours=1))))
+        start = next_year
+    return chunks
+
+def _backfill_chunks(conn, station, end):
+    """
+    The station's backfill chunks that are not done yet, newest first. A station without stored hours
+    and without a plan gets one covering HISTORY_START..end.
+    """
+    conn.execute(BACKFILL_SCHEMA)
+    planned = conn.execute(f"SELECT 1 FROM {BACKFILL_TABLE} WHERE station = ? LIMIT 1", (station.id,)).fetchone()
+    if planned is None and last_time(conn, station.id) is None:
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {BACKFILL_TABLE} (station, start, end) VALUES (?, ?, ?)",
+                [(station.id, time_key(s), time_key(e)) for s, e in year_chunks(HISTORY_START, end)])
+    rows = conn.execute(f"SELECT start, end FROM {BACKFILL_TABLE} WHERE station = ? AND completed_at IS NULL "
+                        f"ORDER BY start DESC", (station.id,)).fetchall()
+    return [(from_epoch([s])[0], from_epoch([e])[0]) for s, e in rows]
+
+def _backfill_end(conn, station):
+    # Last hour covered by the station's completed backfill chunks, whether or not they stored rows
+    last = conn.execute(f"SELECT MAX(end) FROM {BACKFILL_TABLE} WHERE station = ? AND completed_at IS NOT NULL",
+                        (station.id,)).fetchone()[0]
+    return from_epoch([last])[0] if last is not None else None
+
+def _store(conn, station, df, chunk_start=None):
+    """
+    Persists one download in a single transaction; hours that overlap stored ones are upserted, and any
+    stored features that depended on them are recomputed on the next feature store update. The daily/monthly
+    rollups of the touched periods are refreshed, and a backfill chunk is marked done, in the same transaction.
+    """
+    with span("fetch.upsert", station=station.id, rows=len(df)), conn:
+        rows = 0
+        if not df.empty:
+            rows = upsert_hourly(conn, station.id, df)
+            invalidate_features(conn, station.id, df.index.min())
+            update_rollups(conn, station.id, df.index.min(), df.index.max() if chunk_start is not None else None)
+        if chunk_start is not None:
+            conn.execute(f"UPDATE {BACKFILL_TABLE} SET rows = ?, completed_at = ? WHERE station = ? AND start = ?",
+                         (rows, datetime.now(timezone.utc).isoformat(), station.id, time_key(chunk_start)))
+    return rows
+
+@traced("fetch")
+def fetch_and_store(stations=None, source=None, workers=None):
+    """
+    Fetches new hourly data for every station concurrently, each from its own watermark (the last
+    stored hour for that station), and bulk-upserts the results. Stations without any data, or with an
+    unfinished backfill, are fetched in per-year chunks instead (see BACKFILL_TABLE). Returns the
+    number of rows written.
+    """
+    stations = stations if stations is not None else load_stations()
+    source = source if source is not None else MeteostatSource()
+    workers = workers or FETCH_WORKERS
+
+    conn = connect(DB)
+    ensure_hourly_table(conn)
+    ensure_rollups(conn)
+    end = datetime.now(timezone.utc)
+
+    # 1. figure out what to download per station: the missing backfill chunks, or everything after
+    # the last timestamp we already have
+    tasks = [] # (station, start, end, backfill chunk start or None)
+    with span("fetch.watermarks", stations=len(stations)):
+        for station in stations:
+            chunks = _backfill_chunks(conn, station, end)
+            if chunks:
+                print(f"[{station.id}] Backfilling {len(chunks)} yearly chunk(s) from {chunks[-1][0]:%Y-%m-%d} to {chunks[0][1]:%Y-%m-%d}")
+                tasks += [(station, s, e, s) for s, e in chunks]
+                continue
+            # A station whose finished backfill found no data continues from the end of the backfill
+            last = last_time(conn, station.id)
+            if last is None:
+                last = _backfill_end(conn, station)
+            start = last + pd.Timedelta(hours=1) if last is not None else HISTORY_START
+            if start >= end:
+                print(f"[{station.id}] Data is up to date. No new data to fetch.")
+                continue
+            print(f"[{station.id}] Fetching data from {start.strftime('%Y-%m-%d %H:%M:%S %Z')} to {end.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            tasks.append((station, start, end, None))
+
+    if not tasks:
+        conn.close()
+        return 0
+
+    # 2. download with at most `workers` requests in flight; the database is only written from this thread
+    appended = 0
+    failed = 0
+    changed_since = {} # station id -> earliest hour written in this run
+    queue = iter(tasks)
+    with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        running = {}
+        def submit_next():
+            task = next(queue, None)
+            if task is not None:
+                running[pool.submit(_fetch_station, source, *task[:3])] = task
+        for _ in range(min(workers, len(tasks))):
+            submit_next()
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                station, start, _, chunk_start = running.pop(future)
+                submit_next()
+                label = f"[{station.id}]" + (f" {start.year}:" if chunk_start is not None else "")
+                try:
+                    df = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"{label} Fetch failed: {e}")
+                    continue
+                if df.empty and chunk_start is None:
+                    print(f"{label} Fetched data is empty. Nothing to persist.")
+                    continue
+                # 3. persist
+                rows = _store(conn, station, df, chunk_start)
+                del df
+                if rows:
+                    appended += rows
+                    changed_since[station.id] = min(start, changed_since.get(station.id, start))
+                    print(f"{label} Upserted {rows} rows into the database.")
+
+    if failed:
+        print(f"{failed} download(s) failed; an unfinished backfill resumes from its missing chunks on the next run.")
+    if appended:
+        update_feature_store(conn)
+        # Keep the columnar feature snapshot training reads in step with the table. It holds the raw
+        # hourly columns too, so no separate snapshot of `hourly` is kept.
+        for station_id, since in changed_since.items():
+            with span("snapshot.sync", table="features", station=station_id):
+                sync_snapshot(conn, "features", station_id, since=since)
     conn.close()
+    return appended
 
 if __name__ == "__main__":
-    fetch_and_store() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fetch new hourly observations, backfilling new stations year by year.")
+    parser.add_argument("--workers", type=int, default=None, help=f"concurrent downloads (default {FETCH_WORKERS})")
+    parser.add_argument("--source-dir", help="read <station id>.csv files from this directory instead of Meteostat")
+    args = parser.parse_args()
+    fetch_and_store(source=FileSource(args.source_dir) if args.source_dir else None, workers=args.workers)
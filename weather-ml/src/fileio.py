@@ -0,0 +1,28 @@
+import os
+import pathlib
+
+def write_atomic(path, write):
+    """
+    Calls write(tmp_path) on a temporary file next to `path` and renames it over `path`, so readers
+    (serve.py reloads on inode/mtime changes) never see a half-written file. Creates the parent directory.
+    """
+    path = pathlib.Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def write_text_atomic(path, text):
+    return write_atomic(path, lambda tmp_path: tmp_path.write_text(text))
+
+def write_arrow_atomic(path, table):
+    # Uncompressed Arrow IPC file, so readers can memory-map it.
+    # pyarrow is imported here so modules that only write text or numpy files don't need it.
+    import pyarrow as pa
+
+    def write(tmp_path):
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    return write_atomic(path, write)
@@ -0,0 +1,67 @@
+import numpy as np
+from db import to_epoch
+
+# Every forecast run, one row per (station, run, valid hour, target). run_time is the forecast origin
+# (the last observed hour the run started from) and valid_time the hour forecast, both epoch seconds,
+# so the lead time is (valid_time - run_time) / 3600. Re-running the same origin replaces its rows.
+# target is a small integer code (its position in ARCHIVE_TARGETS) instead of a repeated name.
+# The key leads with (station, target, valid_time): verification reads one target's forecasts by
+# valid time, which is then a range scan of the table itself, with no separate index to keep.
+ARCHIVE_TABLE = "forecast_archive"
+ARCHIVE_KEY = ("station", "target", "valid_time", "run_time")
+# Append only: the codes of existing targets must not change
+ARCHIVE_TARGETS = ['temp', 'rhum', 'prcp', 'wspd', 'wdir_sin', 'wdir_cos']
+
+ARCHIVE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+    station TEXT NOT NULL,
+    run_time INTEGER NOT NULL,
+    valid_time INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY ({", ".join(ARCHIVE_KEY)})
+) WITHOUT ROWID
+"""
+
+def _primary_key(conn, table):
+    columns = [(pk, name) for _, name, _, _, _, pk in conn.execute(f"PRAGMA table_info({table})") if pk]
+    return tuple(name for _, name in sorted(columns))
+
+def ensure_archive(conn):
+    conn.execute(ARCHIVE_SCHEMA)
+    # Older archives were keyed by run first and read through a separate valid-time index
+    for index in (f"{ARCHIVE_TABLE}_valid", f"{ARCHIVE_TABLE}_valid_value"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    if _primary_key(conn, ARCHIVE_TABLE) != ARCHIVE_KEY:
+        with conn:
+            conn.execute(f"ALTER TABLE {ARCHIVE_TABLE} RENAME TO {ARCHIVE_TABLE}_old")
+            conn.execute(ARCHIVE_SCHEMA)
+            conn.execute(f"INSERT INTO {ARCHIVE_TABLE} (station, run_time, valid_time, target, value) "
+                         f"SELECT station, run_time, valid_time, target, value FROM {ARCHIVE_TABLE}_old")
+            conn.execute(f"DROP TABLE {ARCHIVE_TABLE}_old")
+        print(f"Rebuilt {ARCHIVE_TABLE} keyed by ({', '.join(ARCHIVE_KEY)})")
+
+def archive_forecast(conn, station_id, run_time, columns) -> int:
+    """
+    Stores one forecast run: `columns` as built by predict.forecast_columns (valid times plus one array
+    per target). Values are rounded to float32, the precision the models predict at, though SQLite
+    still stores each as an 8-byte REAL. Missing values (no model) are not stored.
+    Returns the number of rows written.
+    """
+    ensure_archive(conn)
+    valid_times = to_epoch(columns["time"])
+    rows = []
+    for code, target_var in enumerate(ARCHIVE_TARGETS):
+        values = columns.get(target_var)
+        if values is None:
+            continue
+        values = np.asarray(values, dtype=np.float32)
+        keep = ~np.isnan(values)
+        n = int(keep.sum())
+        rows += zip([station_id] * n, [run_time] * n, valid_times[keep].tolist(), [code] * n, values[keep].tolist())
+    conn.executemany(
+        f"INSERT INTO {ARCHIVE_TABLE} (station, run_time, valid_time, target, value) VALUES (?, ?, ?, ?, ?) "
+        f"ON CONFLICT ({', '.join(ARCHIVE_KEY)}) DO UPDATE SET value = excluded.value",
+        rows,
+    )
+    return len(rows)
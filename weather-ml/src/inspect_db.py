@@ -1,6 +1,7 @@
 import sqlite3
 import pandas as pd
 import pathlib
+from db import connect, from_epoch
 
 DB_PATH = pathlib.Path(__file__).parent.parent / 'weather.sqlite'
 
@@ -12,13 +13,14 @@ def minimal_db_read_test():
     
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect(DB_PATH)
         print("Successfully connected to SQLite database.")
         
         # Attempt the exact type of read that fails in predict.py (simplified query)
         query = "SELECT time, temp FROM hourly ORDER BY time DESC LIMIT 5"
         print(f"Executing query: {query}")
         df = pd.read_sql(query, conn, index_col="time")
+        df.index = from_epoch(df.index) # time is stored as epoch seconds (UTC)
         print("Successfully executed pd.read_sql.")
         print("Sample data:")
         print(df.head())
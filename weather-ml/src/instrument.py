@@ -0,0 +1,231 @@
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pathlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Structured span records (one JSON object per line) go to WEATHER_TRACE: "-" for stderr, or a file path.
+# Unset means spans are only aggregated into the in-process metrics below.
+TRACE_PATH = os.environ.get("WEATHER_TRACE")
+
+# Opt-in cProfile per stage: WEATHER_PROFILE=train,predict (span names) or "all" for every traced() stage.
+# Each profiled span writes <PROFILE_DIR>/<span>-<timestamp>-<pid>.prof, readable with pstats or snakeviz.
+# To sample a running process with py-spy instead, attach to the pid recorded in the span records.
+PROFILE_STAGES = {s.strip() for s in os.environ.get("WEATHER_PROFILE", "").split(",") if s.strip()}
+PROFILE_DIR = pathlib.Path(os.environ.get("WEATHER_PROFILE_DIR", pathlib.Path(__file__).parent.parent / "profiles"))
+
+# Default Prometheus latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- Prometheus-style metrics ---
+
+_REGISTRY = {}
+_registry_lock = threading.Lock()
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[n]) for n in labelnames)
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _REGISTRY[name] = self
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0] # bucket counts, count, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    def render(self):
+        with self._lock:
+            values = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._values.items())
+        lines = self._header()
+        for key, (counts, count, total) in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', repr(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render_metrics() -> str:
+    """
+    All registered metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _registry_lock:
+        metrics = list(_REGISTRY.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+SPAN_SECONDS = Histogram("weather_span_duration_seconds", "Duration of instrumented pipeline spans.", ["span"],
+                         buckets=DEFAULT_BUCKETS + (30.0, 60.0, 300.0))
+
+# --- Spans ---
+
+_current_span = contextvars.ContextVar("weather_span", default=None)
+_trace_lock = threading.Lock()
+_profile_lock = threading.Lock()
+
+def _rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is not available (macOS)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def _emit(record):
+    if not TRACE_PATH:
+        return
+    line = json.dumps(record, default=str)
+    with _trace_lock:
+        if TRACE_PATH == "-":
+            print(line, file=sys.stderr, flush=True)
+        else:
+            with open(TRACE_PATH, "a") as f:
+                f.write(line + "\n")
+
+def _should_profile(name, stage):
+    return name in PROFILE_STAGES or ("all" in PROFILE_STAGES and stage)
+
+@contextmanager
+def span(name, stage=False, **fields):
+    """
+    Times a block and records its wall/CPU time and RSS, e.g.
+
+        with span("train.fit", target="temp", rows=len(y)):
+            model.fit(X, y)
+
+    Each span feeds the weather_span_duration_seconds histogram and, if WEATHER_TRACE is set,
+    is written out as one JSON record. Spans named in WEATHER_PROFILE are also run under cProfile.
+    Extra keyword arguments are copied into the record and may be updated inside the block.
+    """
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    profiler = None
+    if _should_profile(name, stage) and _profile_lock.acquire(blocking=False):
+        # Only one cProfile can be active per process, so concurrent or nested spans are not profiled
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    rss_start = _rss_bytes()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield fields
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        rss_end = _rss_bytes()
+        _current_span.reset(token)
+
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "span": name,
+            "parent": parent,
+            "seconds": round(seconds, 6),
+            "cpu_seconds": round(cpu_seconds, 6),
+            "rss_mb": round(rss_end / 1e6, 1),
+            "rss_delta_mb": round((rss_end - rss_start) / 1e6, 1),
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            **fields,
+        }
+        if error:
+            record["error"] = error
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profile_path = PROFILE_DIR / f"{name}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.prof"
+            profiler.dump_stats(profile_path)
+            _profile_lock.release()
+            record["profile"] = str(profile_path)
+        SPAN_SECONDS.observe(seconds, span=name)
+        _emit(record)
+
+def traced(name):
+    """
+    Decorator form of span() for whole pipeline stages.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, stage=True):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,61 @@
+import hashlib
+import pathlib
+from datetime import datetime, timezone
+import joblib
+import numpy as np
+from fileio import write_atomic
+
+# Bump when the layout of the bundle dict changes in a way older readers cannot handle
+BUNDLE_VERSION = 1
+
+MODEL_DIR = pathlib.Path(__file__).parent / "models"
+BUNDLE_PATH = MODEL_DIR / "bundle.joblib"
+
+class ResidualModel:
+    """
+    A frozen base model plus a small model fitted to the base model's errors on recent hours.
+    Used by incremental training; predicts like any other model in the bundle.
+    """
+    def __init__(self, base, residual):
+        self.base = base
+        self.residual = residual
+
+    def predict(self, X):
+        return self.base.predict(X) + self.residual.predict(X)
+
+def data_hash(X, targets) -> str:
+    """
+    Fingerprint of the exact training data: the feature matrix plus every target array.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(X).view(np.uint8))
+    for name in sorted(targets):
+        h.update(name.encode())
+        h.update(np.ascontiguousarray(targets[name]).view(np.uint8))
+    return h.hexdigest()
+
+def save_bundle(models, feature_names, metadata=None, data_hash=None, path=BUNDLE_PATH):
+    """
+    Writes all target models and their shared feature ordering as one artifact.
+    The dump is left uncompressed so the tree arrays can be memory-mapped on load.
+    """
+    bundle = {
+        "version": BUNDLE_VERSION,
+        "models": dict(models),
+        "feature_names": list(feature_names),
+        "metadata": {"created_at": datetime.now(timezone.utc).isoformat(), **(metadata or {})},
+        "data_hash": data_hash,
+    }
+    # Written next to the target and swapped in, so readers never see a half-written bundle
+    write_atomic(path, lambda tmp_path: joblib.dump(bundle, tmp_path))
+    return bundle
+
+def load_bundle(path=BUNDLE_PATH, mmap_mode="r"):
+    """
+    Loads the bundle with its numpy arrays memory-mapped (read-only by default), so every process
+    that loads the same file shares the underlying pages instead of holding its own copy.
+    """
+    bundle = joblib.load(path, mmap_mode=mmap_mode)
+    if bundle.get("version") != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported model bundle version {bundle.get('version')} in {path} (expected {BUNDLE_VERSION}).")
+    return bundle
@@ -0,0 +1,284 @@
+"""
+Daily pipeline: ingest -> features -> train (one stage per target) -> predict -> verify.
+
+Every stage declares what its output depends on. The runner hashes those inputs together with the
+keys of the upstream stages and skips a stage whose key matches the last successful run and whose
+outputs still exist, so a day without new data only costs the ingest watermark check.
+
+    python pipeline.py                      # run what changed
+    python pipeline.py --force              # rerun everything
+    python pipeline.py --target temp        # retrain and re-predict one target only
+    python pipeline.py --dry-run            # show what would run
+"""
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Tuple
+
+import db
+import feature_store
+import features
+import snapshot
+import train as train_module
+import verify as verify_module
+from db import connect, table_exists
+from fetch import DB, fetch_and_store, HISTORY_START
+from feature_store import update_feature_store, FEATURE_TABLE
+from fileio import write_text_atomic
+from model_bundle import BUNDLE_PATH
+from predict import make_predictions, FORECAST_OUTPUT_PATH
+from snapshot import sync_snapshot
+from stations import DEFAULT_STATION
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "data"
+STATE_PATH = DATA_DIR / "pipeline_state.json" # key and inputs of the last successful run of each stage
+RUN_LOG_PATH = DATA_DIR / "pipeline_runs.jsonl" # one JSON record per pipeline run
+
+class Stage(NamedTuple):
+    name: str
+    deps: Tuple[str, ...]        # upstream stages; their keys are part of this stage's key
+    inputs: Callable[[], dict]   # everything else the output depends on, evaluated after the deps ran
+    outputs: Tuple[pathlib.Path, ...]
+    run: Callable                # run(names, ctx) -> names that succeeded; consecutive stages sharing it run in one call
+    always: bool = False         # always executed; its key is computed from its inputs afterwards and
+                                 # downstream stages only rerun if that key changed
+
+def _code_version(*modules):
+    h = hashlib.sha256()
+    for module in modules:
+        h.update(pathlib.Path(module.__file__).read_bytes())
+    return h.hexdigest()[:16]
+
+def _watermark(table):
+    # Per-station row count and last hour: cheap index scans that change whenever rows are appended
+    conn = connect(DB)
+    try:
+        if not table_exists(conn, table):
+            return {}
+        rows = conn.execute(f"SELECT station, COUNT(*), MAX(time) FROM {table} GROUP BY station").fetchall()
+        return {station: [count, last] for station, count, last in rows}
+    finally:
+        conn.close()
+
+def _key(inputs, dep_keys):
+    payload = json.dumps({"inputs": inputs, "deps": dep_keys}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# --- Stage implementations ---
+
+def _run_ingest(names, ctx):
+    fetch_and_store()
+    return names
+
+def _run_features(names, ctx):
+    previous = ctx["state"].get("features", {}).get("inputs", {})
+    # Stored features were computed by the old code, so a code change means recomputing all of them
+    rebuild = ctx["force"] or previous.get("code") not in (None, _features_inputs()["code"])
+    conn = connect(DB)
+    try:
+        update_feature_store(conn, rebuild=rebuild)
+        stations = [r[0] for r in conn.execute(f"SELECT DISTINCT station FROM {FEATURE_TABLE}")] \
+            if table_exists(conn, FEATURE_TABLE) else []
+        for station_id in stations:
+            sync_snapshot(conn, FEATURE_TABLE, station_id, since=HISTORY_START if rebuild else None)
+    finally:
+        conn.close()
+    return names
+
+def _run_train(names, ctx):
+    targets = [name.split(":", 1)[1] for name in names]
+    # All dirty targets share one feature matrix, so they are fitted in a single train() call.
+    # --force refits from scratch; otherwise train() decides per target between a full and an incremental fit.
+    result = train_module.train(targets=None if len(targets) == len(train_module.TARGET_VARIABLES) else targets,
+                                mode="full" if ctx["force"] else None)
+    # Targets train() skipped on purpose (e.g. no valid hours in the recent window during a sensor outage)
+    # still have their previous model, so the forecast can go ahead; they are retried on the next run
+    ctx["kept"].update(f"train:{t}" for t in result.kept)
+    # train() may have refitted more than was asked for (e.g. no usable bundle yet)
+    return [f"train:{t}" for t in result.trained]
+
+def _run_predict(names, ctx):
+    make_predictions()
+    return names
+
+def _run_verify(names, ctx):
+    verify_module.verify()
+    return names
+
+# Every module whose code shapes the stored features or their snapshot
+FEATURE_MODULES = (features, feature_store, db, snapshot)
+
+def _features_inputs():
+    return {"hourly": _watermark("hourly"), "code": _code_version(*FEATURE_MODULES)}
+
+def _train_inputs(target):
+    return {
+        "target": target,
+        "features": _watermark(FEATURE_TABLE),
+        "code": _code_version(features, train_module),
+        "model_params": train_module.MODEL_PARAMS,
+        "residual_params": train_module.RESIDUAL_PARAMS,
+        "mode": train_module.TRAIN_MODE,
+        "horizons": features.HORIZONS,
+        "validation_fraction": train_module.VALIDATION_FRACTION,
+        "max_rows": train_module.HORIZON_MAX_ROWS,
+        "station": DEFAULT_STATION.id,
+    }
+
+STAGES = [
+    Stage("ingest", (), lambda: {"hourly": _watermark("hourly")}, (DB,), _run_ingest, always=True),
+    Stage("features", ("ingest",), _features_inputs, (DB,), _run_features),
+] + [
+    Stage(f"train:{t}", ("features",), lambda t=t: _train_inputs(t), (BUNDLE_PATH,), _run_train)
+    for t in train_module.TARGET_VARIABLES
+] + [
+    Stage("predict", tuple(f"train:{t}" for t in train_module.TARGET_VARIABLES),
+          lambda: {"features": _watermark(FEATURE_TABLE)}, (FORECAST_OUTPUT_PATH,), _run_predict),
+    # New observations verify older archived forecasts even when no new forecast was made
+    Stage("verify", ("predict",), lambda: {"hourly": _watermark("hourly"), "code": _code_version(verify_module)},
+          (verify_module.VERIFICATION_PATH,), _run_verify),
+]
+
+# --- Runner ---
+
+def load_state(path=STATE_PATH):
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _save_state(state, path=STATE_PATH):
+    write_text_atomic(path, json.dumps(state, indent=2, sort_keys=True))
+
+def _append_run_log(record, path=RUN_LOG_PATH):
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def _groups(stages):
+    # Consecutive stages with the same run function are executed together
+    group = []
+    for stage in stages:
+        if group and stage.run is not group[0].run:
+            yield group
+            group = []
+        group.append(stage)
+    if group:
+        yield group
+
+def _select(stages, targets):
+    # A partial rerun only touches the requested train stages and what depends on them
+    if not targets:
+        return stages, set()
+    unknown = set(targets) - set(train_module.TARGET_VARIABLES)
+    if unknown:
+        raise ValueError(f"Unknown target(s): {', '.join(sorted(unknown))}")
+    forced = {f"train:{t}" for t in targets}
+    return [s for s in stages if s.name in forced or s.name == "predict"], forced
+
+def run(force=False, targets=None, dry_run=False, stages=STAGES):
+    """
+    Runs the stages whose inputs changed since their last successful run. `targets` restricts the run
+    to retraining those targets (always) and refreshing the forecast. Returns the run record.
+    """
+    state = load_state()
+    selected, forced = _select(stages, targets)
+    ctx = {"state": state, "force": force, "kept": set()}
+    record = {"started_at": datetime.now(timezone.utc).isoformat(), "force": force,
+              "targets": targets or None, "dry_run": dry_run, "stages": []}
+    keys = {name: entry["key"] for name, entry in state.items()}
+    ran = set()
+    failed = False
+
+    for group in _groups(selected):
+        pending = []
+        for stage in group:
+            if stage.always:
+                pending.append((stage, None, "always runs"))
+                continue
+            upstream_ran = [d for d in stage.deps if d in ran]
+            inputs = stage.inputs()
+            key = _key(inputs, {d: keys.get(d) for d in stage.deps})
+            previous = state.get(stage.name, {})
+            if force or stage.name in forced:
+                reason = "forced"
+            elif upstream_ran:
+                reason = f"upstream ran: {', '.join(upstream_ran)}"
+            elif previous.get("key") != key:
+                reason = "inputs changed" if previous else "never ran"
+            elif not all(pathlib.Path(p).exists() for p in stage.outputs):
+                reason = "outputs missing"
+            else:
+                record["stages"].append({"stage": stage.name, "status": "skipped", "key": key})
+                print(f"[pipeline] {stage.name}: up to date, skipped")
+                continue
+            pending.append((stage, (key, inputs), reason))
+
+        if not pending:
+            continue
+        names = [stage.name for stage, _, _ in pending]
+        for stage, _, reason in pending:
+            print(f"[pipeline] {stage.name}: {'would run' if dry_run else 'running'} ({reason})")
+        if dry_run:
+            # Stages that always run are judged on the data already in the database
+            record["stages"] += [{"stage": s.name, "status": "would run", "reason": r} for s, _, r in pending]
+            ran.update(s.name for s, _, _ in pending if not s.always)
+            continue
+
+        start = time.perf_counter()
+        try:
+            succeeded = set(pending[0][0].run(names, ctx))
+        except Exception as e:
+            print(f"[pipeline] {', '.join(names)} failed: {e}")
+            record["stages"] += [{"stage": n, "status": "failed", "error": repr(e)} for n in names]
+            failed = True
+            break
+        seconds = round(time.perf_counter() - start, 3)
+
+        for stage, computed, reason in pending:
+            if stage.name in ctx["kept"] and stage.name not in succeeded:
+                # Not recorded in the state, so the stage is due again next run
+                print(f"[pipeline] {stage.name}: kept the previous model")
+                record["stages"].append({"stage": stage.name, "status": "kept", "reason": reason, "seconds": seconds})
+                continue
+            if stage.name not in succeeded:
+                record["stages"].append({"stage": stage.name, "status": "failed", "reason": reason, "seconds": seconds})
+                failed = True
+                continue
+            if computed is not None:
+                key, inputs = computed
+                ran.add(stage.name)
+            else:
+                inputs = stage.inputs()
+                key = _key(inputs, {})
+                if key != state.get(stage.name, {}).get("key"):
+                    ran.add(stage.name)
+            state[stage.name] = {"key": key, "inputs": inputs,
+                                 "finished_at": datetime.now(timezone.utc).isoformat()}
+            keys[stage.name] = key
+            record["stages"].append({"stage": stage.name, "status": "ran", "reason": reason, "key": key, "seconds": seconds})
+        # Recorded after every group, so a later failure doesn't lose the stages that did finish
+        _save_state(state)
+        if failed:
+            break
+
+    record["finished_at"] = datetime.now(timezone.utc).isoformat()
+    record["status"] = "failed" if failed else "ok"
+    if not dry_run:
+        _append_run_log(record)
+    return record
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the weather pipeline, skipping stages whose inputs are unchanged.")
+    parser.add_argument("--force", action="store_true", help="rerun every stage")
+    parser.add_argument("--target", action="append", choices=train_module.TARGET_VARIABLES,
+                        help="retrain only this target (repeatable) and refresh the forecast")
+    parser.add_argument("--dry-run", action="store_true", help="print what would run without running it")
+    args = parser.parse_args()
+    result = run(force=args.force, targets=args.target, dry_run=args.dry_run)
+    sys.exit(1 if result["status"] == "failed" else 0)
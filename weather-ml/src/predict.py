@@ -1,118 +1,148 @@
-import joblib, pandas as pd, json, sqlite3, pathlib
-from features import make_features
-from fetch import DB
+import pandas as pd, numpy as np, json, pathlib
 import os
+import pyarrow as pa
+from feature_store import update_feature_store, load_features
+from features import HORIZONS, make_horizon_matrix
+from tree_export import load_models, BUNDLE_PATH
+from db import connect, time_key
+from forecast_archive import archive_forecast
+from stations import DEFAULT_STATION
+from instrument import span, traced
+from fileio import write_arrow_atomic, write_text_atomic
 
 # Must be consistent with TARGET_VARIABLES in train.py
 TARGET_VARIABLES = ['temp', 'rhum', 'prcp', 'wspd', 'wdir_sin', 'wdir_cos']
+# Rounding: temp, rhum, wspd to 1 decimal; prcp to 2; wdir_sin/cos to 4 for precision
+TARGET_DECIMALS = {'temp': 1, 'rhum': 1, 'wspd': 1, 'prcp': 2, 'wdir_sin': 4, 'wdir_cos': 4}
 
 DB_PATH = pathlib.Path(__file__).parent.parent / 'weather.sqlite'
-MODEL_DIR = pathlib.Path(__file__).parent / "models"
 FORECAST_OUTPUT_PATH = pathlib.Path(__file__).parent / "forecast_24h.json"
-
-def make_predictions():
-    conn = sqlite3.connect(DB_PATH)
-    # Fetch more data for robust feature engineering, e.g., last 72 hours for up to 24h lags/rolling
-    # Order by time ascending to easily get the latest records with .tail()
-    query = "SELECT * FROM hourly ORDER BY time DESC LIMIT 72" # Select all columns
+# Same forecast as an uncompressed Arrow IPC file: a `time` column (timestamp[s, UTC]) plus one float64
+# column per target, NaN where no model was available. Loads into pandas without copying.
+FORECAST_ARROW_PATH = FORECAST_OUTPUT_PATH.with_suffix(".arrow")
+
+def forecast_columns(valid_times, predictions):
+    """
+    Columnar forecast: the valid times plus one rounded float64 array per target (NaN where `predictions` has none).
+    """
+    columns = {"time": pd.DatetimeIndex(valid_times)}
+    for target_var in TARGET_VARIABLES:
+        values = predictions.get(target_var)
+        if values is None:
+            values = np.full(len(valid_times), np.nan)
+        else:
+            values = np.asarray(values, dtype=np.float64)
+            if target_var in TARGET_DECIMALS:
+                values = np.round(values, TARGET_DECIMALS[target_var])
+        columns[target_var] = values
+    return columns
+
+def column_lists(columns):
+    # Per-target Python lists with None in place of NaN, ready for json.dumps
+    lists = {}
+    for target_var in TARGET_VARIABLES:
+        values = columns[target_var]
+        missing = np.isnan(values)
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+        lists[target_var] = values.tolist()
+    return lists
+
+def forecast_records(columns):
+    """
+    The established JSON shape: {"YYYY-MM-DD HH:MM": {target: value, ...}, ...}.
+    """
+    timestamps = columns["time"].strftime("%Y-%m-%d %H:%M")
+    lists = column_lists(columns)
+    rows = zip(*(lists[target_var] for target_var in TARGET_VARIABLES))
+    return {ts: dict(zip(TARGET_VARIABLES, row)) for ts, row in zip(timestamps, rows)}
+
+def write_forecast_arrow(columns, path=FORECAST_ARROW_PATH, metadata=None):
+    times = pa.array(columns["time"].as_unit("s").asi8, type=pa.timestamp("s", tz="UTC"))
+    table = pa.Table.from_arrays(
+        [times] + [pa.array(columns[target_var]) for target_var in TARGET_VARIABLES],
+        names=["time"] + TARGET_VARIABLES,
+    ).replace_schema_metadata(metadata)
+    # Renamed over the old forecast, so serve.py never picks up a half-written file
+    with span("predict.write_arrow", path=path.name):
+        write_arrow_atomic(path, table)
+
+def write_forecast(data, path=FORECAST_OUTPUT_PATH, columns=None, arrow_path=FORECAST_ARROW_PATH, metadata=None):
+    """
+    Writes the JSON forecast and, given `columns`, its Arrow twin first. Without columns (no forecast
+    could be made) a previous Arrow file is removed so the two never disagree.
+    """
+    if columns is not None:
+        write_forecast_arrow(columns, arrow_path, metadata)
+    elif arrow_path.exists():
+        arrow_path.unlink()
+    with span("predict.write_json", path=path.name):
+        write_text_atomic(path, json.dumps(data, indent=2))
+
+@traced("predict")
+def make_predictions(station=DEFAULT_STATION.id):
+    conn = connect(DB_PATH)
     print(f"Connecting to database at: {DB_PATH.resolve()}") # Print resolved path
-    # Load data, explicitly parse time column later for robustness
-    df = pd.read_sql(query, conn, index_col="time") # Keep index_col="time" for now
+    # The forecast origin is the latest observed hour. Its features come straight from the feature
+    # store, which already holds the lag/rolling values computed over the full history.
+    update_feature_store(conn)
+    try:
+        df_origin = load_features(conn, station=station, limit=1)
+    except pd.errors.DatabaseError:
+        df_origin = pd.DataFrame()
     conn.close()
 
-    if df.empty:
+    if df_origin.empty:
         print("No data fetched from database for prediction.")
         # Create an empty JSON file or a file with an error message
-        with open(FORECAST_OUTPUT_PATH, 'w') as f:
-            json.dump({"message": "No data available for prediction."}, f)
+        write_forecast({"message": "No data available for prediction."})
         return
 
-    # Robustly parse the index (which is the 'time' column)
-    df.index = pd.to_datetime(df.index, utc=True, errors='coerce')
-    # df.index.name = 'time' # Explicitly set/restore index name
-    # df.dropna(subset=[df.index.name], inplace=True) # Drop rows where time index became NaT
-    df = df[df.index.notna()] # More direct way to drop rows with NaT in index
-
-    # Sort by time ascending as feature engineering expects this usually for lags
-    df.sort_index(ascending=True, inplace=True)
-
-    if df.empty:
-        print("No valid data after timestamp parsing and NaT drop for prediction.")
-        with open(FORECAST_OUTPUT_PATH, 'w') as f:
-            json.dump({"message": "No valid data available after parsing for prediction."}, f)
+    if not BUNDLE_PATH.exists():
+        print(f"Model bundle not found at {BUNDLE_PATH}. Run train.py first.")
+        write_forecast({})
         return
 
-    # print(f"Raw data for prediction (last 5 rows after NaT filter and sort):\n{df.tail()}")
-
-    # Engineer features using the same function as in training
-    df_features_full = make_features(df)
-    
-    if df_features_full.shape[0] < 24:
-        if not df_features_full.empty: # Only print warning if some data exists
-            print(f"Warning: Not enough data rows ({df_features_full.shape[0]}) after feature engineering to make 24h forecast. Forecasting for available rows.")
-        X_raw_for_forecast = df_features_full
-    else:
-        X_raw_for_forecast = df_features_full.iloc[-24:]
-
-    X_raw_for_forecast = X_raw_for_forecast[pd.notna(X_raw_for_forecast.index)]
-    
-    if X_raw_for_forecast.empty:
-        print("No valid recent data available for prediction. Skipping forecast generation.")
-        output_path = pathlib.Path(__file__).parent / "forecast_24h.json"
-        output_path.write_text(json.dumps({}, indent=2))
+    # All target models come from one bundle and share a single feature ordering. The flat-array
+    # export of its trees is used when current, so predicting doesn't need to import scikit-learn.
+    # Every horizon is scored from the same origin row: one (horizons x features) matrix and one
+    # predict call per target, instead of recursively rebuilding features hour by hour.
+    with span("predict.load_bundle"):
+        bundle = load_models(BUNDLE_PATH)
+    horizons = bundle["metadata"].get("horizons", HORIZONS)
+    try:
+        X_predict, valid_times = make_horizon_matrix(df_origin, bundle["feature_names"], horizons)
+    except ValueError:
+        print("Model bundle was not trained with horizon features. Run train.py to retrain it.")
+        write_forecast({})
         return
+    print(f"Forecasting {len(horizons)} hours ahead from {df_origin.index[-1]}")
 
-    all_forecasts = {}
-
+    predictions = {}
     for target_var in TARGET_VARIABLES:
-        model_filename = MODEL_DIR / f"model_{target_var}.joblib"
-        if not model_filename.exists():
-            print(f"Model for {target_var} not found at {model_filename}. Skipping prediction for this target.")
-            for timestamp_obj in X_raw_for_forecast.index:
-                timestamp_str = timestamp_obj.strftime("%Y-%m-%d %H:%M")
-                if timestamp_str not in all_forecasts:
-                    all_forecasts[timestamp_str] = {}
-                all_forecasts[timestamp_str][target_var] = None
-            continue
-
-        model = joblib.load(model_filename)
-        
-        # Select only the features the model was trained on
-        # Ensure all feature_names_in_ are present in X_raw_for_forecast
-        missing_features = [f for f in model.feature_names_in_ if f not in X_raw_for_forecast.columns]
-        if missing_features:
-            print(f"Error: Missing features for {target_var} model: {missing_features}.")
-            for timestamp_obj in X_raw_for_forecast.index:
-                timestamp_str = timestamp_obj.strftime("%Y-%m-%d %H:%M")
-                if timestamp_str not in all_forecasts:
-                    all_forecasts[timestamp_str] = {}
-                all_forecasts[timestamp_str][target_var] = None
+        model = bundle["models"].get(target_var)
+        if model is None:
+            print(f"No model available for {target_var}. Skipping prediction for this target.")
             continue
-            
-        X_predict = X_raw_for_forecast[model.feature_names_in_]
-        preds = model.predict(X_predict)
-
-        # Populate the all_forecasts dictionary
-        for i, timestamp_obj in enumerate(X_raw_for_forecast.index):
-            timestamp_str = timestamp_obj.strftime("%Y-%m-%d %H:%M")
-            if timestamp_str not in all_forecasts:
-                all_forecasts[timestamp_str] = {}
-            
-            # Rounding: temp, rhum, wspd to 1 decimal; prcp to 2; wdir_sin/cos to 3-4 for precision
-            if target_var in ['temp', 'rhum', 'wspd']:
-                all_forecasts[timestamp_str][target_var] = round(preds[i], 1)
-            elif target_var == 'prcp':
-                all_forecasts[timestamp_str][target_var] = round(preds[i], 2)
-            elif target_var in ['wdir_sin', 'wdir_cos']:
-                all_forecasts[timestamp_str][target_var] = round(preds[i], 4) # More precision for sin/cos
-            else:
-                all_forecasts[timestamp_str][target_var] = preds[i] # Default if no specific rounding
-
-    # Save the combined forecast to JSON
-    # The forecast_24h.json will be created in the same directory as predict.py (i.e. src/)
-    output_path = pathlib.Path(__file__).parent / "forecast_24h.json"
-    output_path.write_text(json.dumps(all_forecasts, indent=2))
-    print(f"Saved multi-target forecast to {output_path}")
+        with span("predict.model", target=target_var, rows=len(X_predict)):
+            predictions[target_var] = model.predict(X_predict)
+
+    # Save the combined forecast as JSON and Arrow
+    # The forecast_24h.json/.arrow files will be created in the same directory as predict.py (i.e. src/)
+    columns = forecast_columns(valid_times, predictions)
+    metadata = {"origin": df_origin.index[-1].isoformat(), "station": station}
+    write_forecast(forecast_records(columns), columns=columns, metadata=metadata)
+    print(f"Saved multi-target forecast to {FORECAST_OUTPUT_PATH} and {FORECAST_ARROW_PATH.name}")
+
+    # Keep every run, so verify.py can score past forecasts once their hours have been observed
+    conn = connect(DB_PATH)
+    try:
+        with span("predict.archive"), conn:
+            archived = archive_forecast(conn, station, time_key(df_origin.index[-1]), columns)
+    finally:
+        conn.close()
+    print(f"Archived {archived} forecast values")
 
 if __name__ == "__main__":
     make_predictions() 
\ No newline at end of file
@@ -0,0 +1,119 @@
+from db import HOURLY_COLUMNS, table_exists, time_key
+
+# Daily and monthly min/mean/max of the hourly variables, per station and UTC period.
+# period is the epoch second at which the day/month starts; n is the number of hourly rows in it.
+# Wind direction (an angle) and the weather condition code (categorical) have no meaningful mean.
+ROLLUP_VARIABLES = [c for c in HOURLY_COLUMNS if c not in ("wdir", "coco")]
+STATS = ["min", "mean", "max"]
+ROLLUP_TABLES = {"day": "rollup_daily", "month": "rollup_monthly"}
+
+# SQL expression mapping the hourly `time` column to the start of its period
+_PERIOD_EXPR = {
+    "day": "(time / 86400) * 86400",
+    "month": "CAST(strftime('%s', time, 'unixepoch', 'start of month') AS INTEGER)",
+}
+# ... and to the start of the next period
+_NEXT_PERIOD_EXPR = {
+    "day": "(time / 86400 + 1) * 86400",
+    "month": "CAST(strftime('%s', time, 'unixepoch', 'start of month', '+1 month') AS INTEGER)",
+}
+_SQL_STATS = {"min": "MIN", "mean": "AVG", "max": "MAX"}
+
+def rollup_columns(variables=ROLLUP_VARIABLES):
+    return [f"{v}_{stat}" for v in variables for stat in STATS]
+
+def _create_rollup_table(conn, table):
+    cols = ", ".join(f'"{c}" REAL' for c in rollup_columns())
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            station TEXT NOT NULL,
+            period INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            {cols},
+            PRIMARY KEY (station, period)
+        ) WITHOUT ROWID
+    """)
+
+def _period_start(conn, resolution, since):
+    # Start of the period containing `since`; everything from there on is re-aggregated
+    return conn.execute(f"SELECT {_PERIOD_EXPR[resolution]} FROM (SELECT ? AS time)", (time_key(since),)).fetchone()[0]
+
+def _period_end(conn, resolution, until):
+    # Start of the period after the one containing `until`
+    return conn.execute(f"SELECT {_NEXT_PERIOD_EXPR[resolution]} FROM (SELECT ? AS time)", (time_key(until),)).fetchone()[0]
+
+def update_rollups(conn, station_id, since=None, until=None) -> int:
+    """
+    Re-aggregates one station's daily and monthly rollups from the period containing `since`
+    (default: all of its history) onwards, up to the period containing `until` if given. Only the
+    touched periods are read from hourly, so a daily fetch costs one day and one month of rows.
+    Returns the number of rollup rows written.
+    """
+    aggregates = ", ".join(
+        f'{_SQL_STATS[stat]}("{v}")' for v in ROLLUP_VARIABLES for stat in STATS
+    )
+    col_list = ", ".join(f'"{c}"' for c in rollup_columns())
+    update_set = ", ".join(f'"{c}" = excluded."{c}"' for c in ["n"] + rollup_columns())
+    written = 0
+    for resolution, table in ROLLUP_TABLES.items():
+        _create_rollup_table(conn, table)
+        where, params = "station = ?", (station_id,)
+        if since is not None:
+            where += " AND time >= ?"
+            params += (_period_start(conn, resolution, since),)
+        if until is not None:
+            where += " AND time < ?"
+            params += (_period_end(conn, resolution, until),)
+        cursor = conn.execute(f"""
+            INSERT INTO {table} (station, period, n, {col_list})
+            SELECT station, {_PERIOD_EXPR[resolution]} AS period, COUNT(*), {aggregates}
+            FROM hourly WHERE {where}
+            GROUP BY period
+            ON CONFLICT (station, period) DO UPDATE SET {update_set}
+        """, params)
+        written += cursor.rowcount
+    return written
+
+def ensure_rollups(conn):
+    """
+    Builds the rollup tables from the full hourly history once, e.g. for databases created before they existed.
+    """
+    if all(table_exists(conn, t) for t in ROLLUP_TABLES.values()) or not table_exists(conn, "hourly"):
+        return
+    print("Building daily and monthly rollups from the hourly history...")
+    with conn:
+        for (station_id,) in conn.execute("SELECT DISTINCT station FROM hourly").fetchall():
+            update_rollups(conn, station_id)
+
+def history_columns(resolution, variables):
+    return list(variables) if resolution == "hour" else rollup_columns(variables)
+
+def iter_history(conn, station_id, resolution="day", variables=None, start=None, end=None, chunk_rows=5000):
+    """
+    Yields lists of (time, value, ...) rows in time order, at most `chunk_rows` at a time, so callers can
+    stream a long range without holding it in memory. "hour" reads the hourly table itself; "day" and
+    "month" read the rollups, with min/mean/max columns per variable (see history_columns). Times are epoch seconds.
+    """
+    if resolution == "hour":
+        table, time_col = "hourly", "time"
+    else:
+        table, time_col = ROLLUP_TABLES[resolution], "period"
+    variables = variables if variables is not None else (HOURLY_COLUMNS if resolution == "hour" else ROLLUP_VARIABLES)
+    clauses, params = ["station = ?"], [station_id]
+    if start is not None:
+        # A day or month is included if `start` falls inside it
+        clauses.append(f"{time_col} >= ?")
+        params.append(time_key(start) if resolution == "hour" else _period_start(conn, resolution, start))
+    if end is not None:
+        clauses.append(f"{time_col} <= ?")
+        params.append(time_key(end))
+    if not table_exists(conn, table):
+        return
+    col_list = ", ".join(f'"{c}"' for c in history_columns(resolution, variables))
+    cursor = conn.execute(
+        f"SELECT {time_col}, {col_list} FROM {table} WHERE {' AND '.join(clauses)} ORDER BY {time_col}", params)
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield rows
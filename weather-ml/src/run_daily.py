@@ -1,8 +1,9 @@
-from fetch import fetch_and_store
-from train import train
-from predict import make_prediction
+import sys
+from pipeline import run
 
+# Kept as the entry point for scheduled runs; the pipeline skips stages whose inputs did not change.
+# Use pipeline.py directly for --force, --target and --dry-run.
+# Each stage is instrumented: set WEATHER_TRACE=- (or a file path) for per-span timing/memory records,
+# and WEATHER_PROFILE=all (or e.g. train,predict) to write a cProfile dump per stage.
 if __name__ == "__main__":
-    fetch_and_store()
-    train()
-    make_prediction() 
\ No newline at end of file
+    sys.exit(1 if run()["status"] == "failed" else 0)
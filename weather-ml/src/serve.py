@@ -1,17 +1,93 @@
+import asyncio
+import hashlib
 import json
+import os
 import pathlib
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 import uvicorn
+from features import make_features, make_horizon_matrix, HORIZONS
+from feature_store import load_features
+from db import connect, HOURLY_COLUMNS, from_epoch
+from rollups import iter_history, history_columns, ROLLUP_VARIABLES
+from model_bundle import load_bundle
+from tree_export import load_trees, BUNDLE_PATH, TREES_PATH
+from predict import TARGET_VARIABLES, DB_PATH, FORECAST_ARROW_PATH, forecast_columns, column_lists
+from stations import DEFAULT_STATION
+from instrument import span, render_metrics, Counter, Gauge, Histogram
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the target models once at startup so /predict never pays for joblib.load per request
+    await run_in_threadpool(prediction_batcher.load_models)
+    await forecast_events.check()
+    watcher = asyncio.create_task(forecast_events.watch())
+    yield
+    watcher.cancel()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Weather Forecast API",
-    description="Provides 24-hour weather forecasts.",
-    version="0.1.0"
+    description="Provides 24-hour weather forecasts and on-demand predictions.",
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
+REQUEST_SECONDS = Histogram("weather_http_request_duration_seconds", "HTTP request latency.",
+                            ["method", "path", "status"])
+FORECAST_CACHE_LOOKUPS = Counter("weather_forecast_cache_lookups_total",
+                                 "Forecast cache lookups; result is hit (served from memory) or miss (file reloaded).",
+                                 ["result"])
+FORECAST_AGE = Gauge("weather_forecast_age_seconds", "Seconds since the forecast file was last written.")
+BUNDLE_AGE = Gauge("weather_model_bundle_age_seconds", "Seconds since the loaded model bundle was written.")
+PREDICT_BATCH_ROWS = Histogram("weather_predict_batch_rows", "(origin, horizon) rows scored per /predict batch.",
+                               buckets=(24, 96, 240, 960, 2400, 9600, 24000, 50000))
+EVENT_SUBSCRIBERS = Gauge("weather_event_subscribers", "Open /events connections.")
+PREDICT_BATCH_REQUESTS = Histogram("weather_predict_batch_requests", "Requests coalesced into one /predict batch.",
+                                   buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+class MetricsMiddleware:
+    """
+    Records the latency of every HTTP request, labelled by route template rather than raw path
+    so ids or query strings don't create new series. Plain ASGI, so it adds no per-request task.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"],
+                                    path=getattr(route, "path", "unmatched"), status=status)
+
+app.add_middleware(MetricsMiddleware)
+
 # Configure CORS (Cross-Origin Resource Sharing)
 # Allows requests from any origin during development. 
 # For production, you might want to restrict this to specific origins.
@@ -19,7 +95,7 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allows all origins
     allow_credentials=True,
-    allow_methods=["GET"], # Allows only GET requests for this simple API
+    allow_methods=["GET", "POST"], # GET for forecasts, POST for /predict
     allow_headers=["*"],   # Allows all headers
 )
 
@@ -27,28 +103,493 @@ app.add_middleware(
 # Assumes serve.py is in the src/ directory, and forecast_24h.json is also in src/
 FORECAST_FILE = pathlib.Path(__file__).parent / "forecast_24h.json"
 
+EMPTY_FORECAST = {"message": "Forecast data is currently empty or not available.", "data": {}}
+
+# Media type of the columnar forecast (Arrow IPC file format), served from FORECAST_ARROW_PATH
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+
+class CachedForecast(NamedTuple):
+    key: tuple            # (st_ino, st_mtime_ns, st_size) of the file this entry was built from
+    body: bytes           # pre-encoded response body
+    etag: str
+    last_modified: str
+    mtime: float
+    error: Optional[str]  # set when the file could not be decoded
+
+def _stat_key(st):
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class ForecastCache:
+    """
+    Keeps the parsed forecast and its encoded response bytes in memory.
+    The file is only re-read when its inode, mtime or size changes (predict.py replaces it atomically),
+    and a fresh entry is swapped in with a single assignment so readers never see a partial state.
+    """
+    media_type = "application/json"
+
+    def __init__(self, path):
+        self.path = path
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def _encode(self, raw):
+        # Returns the response body; raises ValueError if the file can't be decoded
+        forecast_data = json.loads(raw)
+        if not forecast_data: # Check if the JSON file is empty (e.g. {} or [])
+            forecast_data = EMPTY_FORECAST
+        # Same compact encoding FastAPI's JSONResponse would produce
+        return json.dumps(forecast_data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def _load(self):
+        with self._lock:
+            with open(self.path, "rb") as f:
+                key = _stat_key(os.fstat(f.fileno()))
+                entry = self._entry
+                if entry is not None and entry.key == key:
+                    return entry # another request reloaded it while we waited for the lock
+                raw = f.read()
+            mtime = key[1] / 1e9
+            error = None
+            try:
+                body = self._encode(raw)
+            except ValueError:
+                body = b""
+                error = "Error decoding forecast JSON data." if self.media_type == "application/json" \
+                    else "Error decoding forecast Arrow data."
+            entry = CachedForecast(
+                key=key,
+                body=body,
+                etag='"' + hashlib.blake2b(raw, digest_size=16).hexdigest() + '"',
+                last_modified=formatdate(mtime, usegmt=True),
+                mtime=mtime,
+                error=error,
+            )
+            self._entry = entry
+            return entry
+
+    async def get(self):
+        # A stat is the only work on the event loop when nothing changed; reloads run in the threadpool
+        key = _stat_key(os.stat(self.path))
+        entry = self._entry
+        if entry is None or entry.key != key:
+            FORECAST_CACHE_LOOKUPS.inc(result="miss")
+            entry = await run_in_threadpool(self._load)
+        else:
+            FORECAST_CACHE_LOOKUPS.inc(result="hit")
+        return entry
+
+class ArrowForecastCache(ForecastCache):
+    """
+    The same cache for the columnar forecast; the file bytes are served as they are.
+    """
+    media_type = ARROW_MEDIA_TYPE
+
+    def _encode(self, raw):
+        try:
+            pa.ipc.open_file(pa.py_buffer(raw)) # validates the footer and schema
+        except pa.ArrowInvalid as e:
+            raise ValueError(str(e))
+        return raw
+
+forecast_cache = ForecastCache(FORECAST_FILE)
+arrow_forecast_cache = ArrowForecastCache(FORECAST_ARROW_PATH)
+
+def _wants_arrow(request):
+    # Arrow only when the client lists it with a higher q than JSON; browsers and plain clients get JSON
+    accept = request.headers.get("accept")
+    if not accept:
+        return False
+    quality = {}
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        quality[media_type.lower()] = max(q, quality.get(media_type.lower(), 0.0))
+    arrow_q = quality.get(ARROW_MEDIA_TYPE, 0.0)
+    json_q = max(quality.get("application/json", 0.0), quality.get("application/*", 0.0), quality.get("*/*", 0.0))
+    return arrow_q > 0 and arrow_q >= json_q
+
+def _not_modified(request, entry):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or entry.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(entry.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
 @app.get("/forecast")
-async def get_forecast():
+async def get_forecast(request: Request):
     """
     Retrieves the latest 24-hour weather forecast.
     The forecast is read from the `forecast_24h.json` file, which is updated by the daily batch job.
+    With `Accept: application/vnd.apache.arrow.file` the columnar `forecast_24h.arrow` is returned instead.
+    It is served from memory and supports conditional requests via ETag / Last-Modified.
     """
-    if not FORECAST_FILE.exists():
-        raise HTTPException(status_code=404, detail=f"Forecast file not found at {FORECAST_FILE}")
-    
+    cache = arrow_forecast_cache if _wants_arrow(request) else forecast_cache
     try:
-        with open(FORECAST_FILE, 'r') as f:
-            forecast_data = json.load(f)
-        if not forecast_data: # Check if the JSON file is empty (e.g. {} or [])
-            # Return a specific message or an empty dict, depending on desired behavior
-            return {"message": "Forecast data is currently empty or not available.", "data": {}}
-        return forecast_data
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Error decoding forecast JSON data.")
+        entry = await cache.get()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Forecast file not found at {cache.path}")
     except Exception as e:
         # Catch any other unexpected errors during file reading
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+    if entry.error:
+        raise HTTPException(status_code=500, detail=entry.error)
+
+    headers = {"ETag": entry.etag, "Last-Modified": entry.last_modified, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=cache.media_type, headers=headers)
+
+# --- Forecast update events ---
+
+FORECAST_WATCH_SECONDS = 0.5   # how often the forecast file is checked for a new version
+EVENTS_KEEPALIVE_SECONDS = 15  # idle subscribers get a comment line this often, so proxies keep the connection
+EVENTS_RETRY_MS = 2000         # EventSource reconnect delay after the connection drops
+
+class ForecastEvents:
+    """
+    Watches the forecast file and pushes its version (the JSON ETag) to /events subscribers when it changes.
+    The whole process does one stat per FORECAST_WATCH_SECONDS, however many clients are connected.
+    Each subscriber only holds the latest version, so a slow client can't make events pile up.
+    """
+    def __init__(self, cache, interval=FORECAST_WATCH_SECONDS):
+        self.cache = cache
+        self.interval = interval
+        self.version = None
+        self._key = None
+        self._subscribers = set()
+
+    async def check(self):
+        try:
+            key = _stat_key(os.stat(self.cache.path))
+        except FileNotFoundError:
+            key = None
+        if key == self._key:
+            return
+        self._key = key
+        version = None
+        if key is not None:
+            try:
+                entry = await self.cache.get()
+                version = entry.etag if not entry.error else None
+            except FileNotFoundError:
+                pass
+        if version != self.version:
+            self.version = version
+            for queue in self._subscribers:
+                _offer(queue, version)
+
+    async def watch(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Forecast watcher error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        EVENT_SUBSCRIBERS.set(len(self._subscribers))
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+        EVENT_SUBSCRIBERS.set(len(self._subscribers))
+
+def _offer(queue, version):
+    # Replace an undelivered version with the newer one
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(version)
+
+forecast_events = ForecastEvents(forecast_cache)
+
+def _sse(version):
+    return f"id: {version or ''}\nevent: forecast\ndata: {json.dumps({'version': version})}\n\n"
+
+async def _event_stream(request, last_event_id):
+    queue = forecast_events.subscribe()
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        # A reconnecting client that already has the current version isn't sent it again
+        if forecast_events.version != (last_event_id or None):
+            yield _sse(forecast_events.version)
+        while True:
+            try:
+                version = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            yield _sse(version)
+    finally:
+        forecast_events.unsubscribe(queue)
+
+@app.get("/events")
+async def forecast_updates(request: Request):
+    """
+    Server-Sent Events stream announcing new forecasts, for clients that would otherwise poll /forecast.
+    Sends the current version on connect, then an event named "forecast" with data {"version": <ETag>}
+    (null when no forecast is available) whenever predict.py writes a new one, typically within a second.
+    """
+    return StreamingResponse(
+        _event_stream(request, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- On-demand predictions ---
+
+BATCH_WINDOW_SECONDS = 0.005 # How long the first request of a batch waits for others to join it
+MAX_BATCH_ROWS = 50_000      # Flush early once this many (origin, horizon) rows are waiting
+MAX_REQUEST_ROWS = 10_000    # Upper bound on observations per request
+MAX_REQUEST_ORIGINS = 1_000  # Upper bound on forecast origins (hours in range) per request
+
+class PredictionBatcher:
+    """
+    Keeps the model bundle resident and coalesces concurrent /predict requests.
+    Forecast origins that arrive within the batching window are expanded to (origin, horizon) rows,
+    stacked and scored with a single model.predict call per target, then split back per request.
+    At startup the flat tree export answers right away while the scikit-learn bundle, which scores
+    large batches several times faster, is loaded in the background and swapped in.
+    """
+    def __init__(self, bundle_path, window=BATCH_WINDOW_SECONDS, max_rows=MAX_BATCH_ROWS):
+        self.bundle_path = bundle_path
+        self.window = window
+        self.max_rows = max_rows
+        self.bundle = None
+        self._bundle_key = None
+        self._latest_key = None # newest bundle file seen; a slower load of an older one is discarded
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_rows = 0
+        self._flush_task = None
+
+    def load_models(self):
+        # Cheap when nothing changed; picks up a bundle rewritten by the daily training run
+        try:
+            key = _stat_key(os.stat(self.bundle_path))
+        except FileNotFoundError:
+            if self.bundle is None:
+                print(f"Model bundle not found at {self.bundle_path}. /predict is unavailable until train.py has run.")
+            return
+        if key == self._bundle_key:
+            return
+        self._latest_key = key
+        cold = self.bundle is None
+        trees = load_trees(self.bundle_path.with_name(TREES_PATH.name), self.bundle_path) if cold else None
+        if trees is not None:
+            with self._lock:
+                self.bundle, self._bundle_key = trees, key
+            print(f"Loaded exported trees for targets {sorted(trees['models'])}; loading the full bundle in the background")
+            threading.Thread(target=self._load_bundle, args=(key,), daemon=True).start()
+        else:
+            self._load_bundle(key)
+
+    def _load_bundle(self, key):
+        with span("serve.load_bundle"):
+            bundle = load_bundle(self.bundle_path)
+        with self._lock:
+            if key != self._latest_key:
+                return
+            self.bundle, self._bundle_key = bundle, key
+        print(f"Loaded model bundle with targets {sorted(bundle['models'])}")
+
+    def _predict_batch(self, frames):
+        self.load_models()
+        feature_names = self.bundle["feature_names"]
+        horizons = self.bundle["metadata"].get("horizons", HORIZONS)
+        matrices = [make_horizon_matrix(df, feature_names, horizons) for df in frames]
+        X = np.vstack([X_i for X_i, _ in matrices])
+        PREDICT_BATCH_ROWS.observe(len(X))
+        PREDICT_BATCH_REQUESTS.observe(len(frames))
+        bounds = np.cumsum([len(X_i) for X_i, _ in matrices])[:-1]
+        results = [{"valid_times": valid_times} for _, valid_times in matrices]
+        for target_var in TARGET_VARIABLES:
+            model = self.bundle["models"].get(target_var)
+            with span("serve.predict", target=target_var, rows=len(X)):
+                preds = model.predict(X) if model is not None else None
+            for i, part in enumerate(np.split(preds, bounds) if preds is not None else [None] * len(frames)):
+                results[i][target_var] = part
+        return results
+
+    async def _flush_after(self, delay):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        if not batch:
+            return
+        try:
+            results = await run_in_threadpool(self._predict_batch, [df for df, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def predict(self, df_origin):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((df_origin, future))
+        self._pending_rows += len(df_origin) * len(HORIZONS)
+        if self._pending_rows >= self.max_rows:
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+            self._flush_task = asyncio.create_task(self._flush_after(0))
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after(self.window))
+        return await future
+
+prediction_batcher = PredictionBatcher(BUNDLE_PATH)
+
+class PredictRequest(BaseModel):
+    # Either recent raw observations (each with a "time" plus any hourly variables such as temp, rhum, ...),
+    # forecast from the last one, or a UTC time range of stored hours, each of which is a forecast origin.
+    observations: Optional[List[Dict[str, Any]]] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    station: str = DEFAULT_STATION.id
+
+def _features_from_observations(observations):
+    df = pd.DataFrame.from_records(observations)
+    if "time" not in df.columns:
+        raise HTTPException(status_code=422, detail="Every observation needs a 'time' field.")
+    df.index = pd.to_datetime(df.pop("time"), utc=True, errors="coerce")
+    df = df[df.index.notna()].sort_index()
+    df = df.apply(pd.to_numeric, errors="coerce")
+    return make_features(df)
+
+def _features_from_store(station, start, end):
+    conn = connect(DB_PATH)
+    try:
+        return load_features(conn, station=station, start=start, end=end, limit=MAX_REQUEST_ORIGINS + 1)
+    except pd.errors.DatabaseError:
+        raise HTTPException(status_code=404, detail="No feature data available in the database.")
+    finally:
+        conn.close()
+
+@app.post("/predict")
+async def predict_targets(payload: PredictRequest):
+    """
+    Forecasts all target variables 1..24h ahead from the given observations or from every hour of a
+    stored time range. Models stay loaded in the API process and concurrent requests are scored together.
+    """
+    if prediction_batcher.bundle is None:
+        await run_in_threadpool(prediction_batcher.load_models)
+        if prediction_batcher.bundle is None:
+            raise HTTPException(status_code=503, detail="No trained models available.")
+
+    if payload.observations:
+        if len(payload.observations) > MAX_REQUEST_ROWS:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_REQUEST_ROWS} observations per request.")
+        df_origin = (await run_in_threadpool(_features_from_observations, payload.observations)).iloc[-1:]
+    elif payload.start is not None or payload.end is not None:
+        df_origin = await run_in_threadpool(_features_from_store, payload.station, payload.start, payload.end)
+        if len(df_origin) > MAX_REQUEST_ORIGINS:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_REQUEST_ORIGINS} hours per request.")
+    else:
+        raise HTTPException(status_code=422, detail="Provide either 'observations' or a 'start'/'end' range.")
+
+    if df_origin.empty:
+        return {"forecasts": []}
+
+    preds = await prediction_batcher.predict(df_origin)
+
+    timestamps = preds["valid_times"].strftime("%Y-%m-%d %H:%M")
+    columns = column_lists(forecast_columns(preds["valid_times"], preds))
+    # Rows are origins outer, horizons inner
+    n_h = len(timestamps) // len(df_origin)
+    forecasts = []
+    for k, origin in enumerate(df_origin.index.strftime("%Y-%m-%d %H:%M")):
+        predictions = {
+            timestamps[i]: {target_var: columns[target_var][i] for target_var in TARGET_VARIABLES}
+            for i in range(k * n_h, (k + 1) * n_h)
+        }
+        forecasts.append({"origin": origin, "predictions": predictions})
+    return {"forecasts": forecasts}
+
+# --- Historical observations ---
+
+HISTORY_RESOLUTIONS = {"hour": "%Y-%m-%d %H:%M", "day": "%Y-%m-%d", "month": "%Y-%m"}
+HISTORY_CHUNK_ROWS = 5000
+
+def _history_chunks(station, resolution, variables, start, end):
+    # Runs in the threadpool one chunk at a time, so the connection must not be bound to a single thread
+    conn = connect(DB_PATH, check_same_thread=False)
+    try:
+        columns = ["time"] + history_columns(resolution, variables)
+        yield (f'{{"station":{json.dumps(station)},"resolution":"{resolution}",'
+               f'"columns":{json.dumps(columns)},"data":[').encode()
+        time_format = HISTORY_RESOLUTIONS[resolution]
+        first = True
+        for rows in iter_history(conn, station, resolution, variables, start, end, HISTORY_CHUNK_ROWS):
+            times = from_epoch([r[0] for r in rows]).strftime(time_format)
+            # One dumps per chunk; the surrounding brackets are dropped to splice it into the open array
+            body = json.dumps([[t, *r[1:]] for t, r in zip(times, rows)])[1:-1]
+            yield ((b"" if first else b",") + body.encode())
+            first = False
+        yield b"]}"
+    finally:
+        conn.close()
+
+@app.get("/history")
+async def get_history(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      variables: Optional[str] = None, resolution: str = "day", station: str = DEFAULT_STATION.id):
+    """
+    Stored observations for a UTC time range. `resolution` is "hour" (raw hourly rows), or "day"/"month",
+    which read the pre-aggregated rollups and return <variable>_min/_mean/_max columns.
+    `variables` is a comma-separated list (default: all). The rows are streamed as they are read:
+    {"station", "resolution", "columns": ["time", ...], "data": [[time, value, ...], ...]}
+    """
+    if resolution not in HISTORY_RESOLUTIONS:
+        raise HTTPException(status_code=422, detail=f"resolution must be one of {', '.join(HISTORY_RESOLUTIONS)}.")
+    allowed = HOURLY_COLUMNS if resolution == "hour" else ROLLUP_VARIABLES
+    selected = [v.strip() for v in variables.split(",") if v.strip()] if variables else list(allowed)
+    unknown = [v for v in selected if v not in allowed]
+    if unknown or not selected:
+        raise HTTPException(status_code=422, detail=f"Unknown variables {unknown}; available at {resolution} resolution: {allowed}")
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=422, detail="start must not be after end.")
+    return StreamingResponse(_history_chunks(station, resolution, selected, start, end), media_type="application/json")
+
+def _file_age(path, now):
+    try:
+        return now - os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: request latency histograms, forecast cache hits and misses,
+    forecast and model ages, /predict batch sizes and the durations of instrumented spans.
+    """
+    now = time.time()
+    forecast_age = _file_age(FORECAST_FILE, now)
+    if forecast_age is not None:
+        FORECAST_AGE.set(round(forecast_age, 3))
+    if prediction_batcher.bundle is not None:
+        bundle_age = _file_age(prediction_batcher.bundle_path, now)
+        if bundle_age is not None:
+            BUNDLE_AGE.set(round(bundle_age, 3))
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # To run this application:
 # 1. Ensure you are in the weather-ml/src directory.
 # 2. Activate your virtual environment: source ../.venv/bin/activate (if .venv is in weather-ml/)
@@ -0,0 +1,151 @@
+import json
+import os
+import pathlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from db import table_exists, table_columns, time_key, from_epoch
+from instrument import span
+from fileio import write_arrow_atomic, write_text_atomic
+
+# Columnar copy of (station, time)-keyed tables: one uncompressed Arrow IPC file per station and year,
+#   data/snapshot/<table>/<station>/<year>.arrow
+# Uncompressed IPC files can be memory-mapped, so reads are zero-copy and only touch the projected columns.
+SNAPSHOT_DIR = pathlib.Path(__file__).parent.parent / "data" / "snapshot"
+
+def _station_dir(table, station_id, root):
+    return pathlib.Path(root) / table / station_id
+
+def _read_manifest(station_dir):
+    path = station_dir / "_manifest.json"
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _write_partition(path, df, columns):
+    # Built from the raw numpy arrays so NaN stays NaN instead of becoming an Arrow null,
+    # which keeps the float columns convertible to pandas without a copy
+    arrays = [pa.array(df["time"].to_numpy(dtype=np.int64))]
+    arrays += [pa.array(df[c].to_numpy(dtype=np.float64, na_value=np.nan)) for c in columns]
+    write_arrow_atomic(path, pa.Table.from_arrays(arrays, names=["time"] + columns))
+
+def sync_snapshot(conn, table, station_id, since=None, root=SNAPSHOT_DIR) -> int:
+    """
+    Brings one station's snapshot of `table` up to date with the database.
+    Only the year partitions from `since` (default: the last snapshotted hour) onwards are rewritten,
+    so a daily run touches a single small file. Returns the number of partitions written.
+    """
+    if not table_exists(conn, table):
+        return 0
+    columns = [c for c in table_columns(conn, table) if c not in ("station", "time")]
+    station_dir = _station_dir(table, station_id, root)
+    manifest = _read_manifest(station_dir)
+
+    last = conn.execute(f"SELECT MAX(time) FROM {table} WHERE station = ?", (station_id,)).fetchone()[0]
+    if last is None:
+        return 0
+
+    if manifest is None or manifest["columns"] != columns:
+        # First snapshot, or the table layout changed: rebuild every partition
+        for old in station_dir.glob("*.arrow"):
+            old.unlink()
+        first = conn.execute(f"SELECT MIN(time) FROM {table} WHERE station = ?", (station_id,)).fetchone()[0]
+        from_year = from_epoch([first])[0].year
+    else:
+        if since is None and manifest["last_time"] >= last:
+            return 0
+        since_ts = time_key(since) if since is not None else manifest["last_time"]
+        from_year = from_epoch([min(since_ts, manifest["last_time"] + 1)])[0].year
+
+    os.makedirs(station_dir, exist_ok=True)
+    col_list = ", ".join(f'"{c}"' for c in columns)
+    written = 0
+    for year in range(from_year, from_epoch([last])[0].year + 1):
+        lo = time_key(pd.Timestamp(year=year, month=1, day=1, tz="UTC"))
+        hi = time_key(pd.Timestamp(year=year + 1, month=1, day=1, tz="UTC"))
+        df = pd.read_sql(
+            f"SELECT time, {col_list} FROM {table} "
+            f"WHERE station = ? AND time >= ? AND time < ? ORDER BY time",
+            conn, params=(station_id, lo, hi),
+        )
+        path = station_dir / f"{year}.arrow"
+        if df.empty:
+            if path.exists():
+                path.unlink()
+            continue
+        _write_partition(path, df, columns)
+        written += 1
+
+    new_manifest = {"columns": columns, "last_time": int(last)}
+    write_text_atomic(station_dir / "_manifest.json", json.dumps(new_manifest))
+    return written
+
+def snapshot_columns(table, station_id, root=SNAPSHOT_DIR):
+    manifest = _read_manifest(_station_dir(table, station_id, root))
+    return None if manifest is None else manifest["columns"]
+
+def _partitions(station_dir, start=None):
+    paths = sorted(station_dir.glob("*.arrow"), key=lambda p: int(p.stem))
+    if start is not None:
+        paths = [p for p in paths if int(p.stem) >= start.year]
+    return paths
+
+def _utc(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts
+
+def _read_partition(path, columns):
+    # The returned buffers keep the mapping alive, so the file is not closed explicitly here
+    t = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    return t.select(["time"] + list(columns)) if columns is not None else t
+
+def _to_frame(arrow_table):
+    df = arrow_table.to_pandas(split_blocks=True, use_threads=True)
+    df.index = from_epoch(df.pop("time").to_numpy()).rename("time")
+    return df
+
+def snapshot_bounds(table, station_id, root=SNAPSHOT_DIR):
+    """
+    First and last time (UTC) in one station's snapshot without reading it, or None if there is none.
+    """
+    station_dir = _station_dir(table, station_id, root)
+    manifest = _read_manifest(station_dir)
+    paths = _partitions(station_dir)
+    if manifest is None or not paths:
+        return None
+    first = _read_partition(paths[0], []).column("time")[0].as_py()
+    return from_epoch([first])[0], from_epoch([manifest["last_time"]])[0]
+
+def read_snapshot(table, station_id, columns=None, start=None, root=SNAPSHOT_DIR) -> pd.DataFrame:
+    """
+    Reads one station's snapshot with the partitions memory-mapped and only `columns` materialized.
+    `start` skips whole year partitions before it. Returns a frame indexed by UTC time.
+    """
+    start_ts = _utc(start) if start is not None else None
+    paths = _partitions(_station_dir(table, station_id, root), start_ts)
+
+    with span("snapshot.read", table=table, station=station_id, partitions=len(paths)) as record:
+        tables = [_read_partition(path, columns) for path in paths]
+        if not tables:
+            return pd.DataFrame(columns=list(columns or []), index=from_epoch([]), dtype="float64")
+        df = _to_frame(pa.concat_tables(tables))
+        record["rows"] = len(df)
+    if start is not None:
+        df = df[df.index >= start_ts]
+    return df
+
+def iter_snapshot(table, station_id, columns=None, start=None, root=SNAPSHOT_DIR):
+    """
+    Like read_snapshot(), but yields the history one year partition at a time in time order, so only
+    one partition is materialized at once however long the history is.
+    """
+    start_ts = _utc(start) if start is not None else None
+    for path in _partitions(_station_dir(table, station_id, root), start_ts):
+        with span("snapshot.read", table=table, station=station_id, partitions=1) as record:
+            df = _to_frame(_read_partition(path, columns))
+            record["rows"] = len(df)
+        if start is not None:
+            df = df[df.index >= start_ts]
+        if not df.empty:
+            yield df
@@ -0,0 +1,27 @@
+import json
+import pathlib
+from typing import NamedTuple
+
+class Station(NamedTuple):
+    id: str
+    lat: float
+    lon: float
+    name: str = ""
+
+# The original single location. Used when no stations.json exists and as the default for training/prediction.
+DEFAULT_STATION = Station("zeegse", 53.06, 6.66, "Zeegse")
+
+# Optional registry file: a JSON list of {"id": ..., "lat": ..., "lon": ..., "name": ...}
+STATIONS_FILE = pathlib.Path(__file__).parent.parent / "stations.json"
+
+def load_stations(path=STATIONS_FILE):
+    path = pathlib.Path(path)
+    if not path.exists():
+        return [DEFAULT_STATION]
+    with open(path) as f:
+        entries = json.load(f)
+    stations = [Station(str(e["id"]), float(e["lat"]), float(e["lon"]), e.get("name", "")) for e in entries]
+    ids = [s.id for s in stations]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate station ids in {path}")
+    return stations
@@ -1,75 +1,443 @@
 from fetch import DB
-from features import make_features
-import pandas as pd, sqlite3, joblib
+from feature_store import update_feature_store
+from snapshot import sync_snapshot, snapshot_columns, snapshot_bounds, read_snapshot, iter_snapshot
+from model_bundle import save_bundle, load_bundle, data_hash, ResidualModel, BUNDLE_PATH
+from tree_export import export_bundle
+from stations import DEFAULT_STATION
+from db import connect, to_epoch, time_key
+from features import HORIZONS, HORIZON_FEATURES, horizon_features
+from instrument import span, traced
+import numpy as np, pandas as pd, sklearn
 from sklearn.ensemble import HistGradientBoostingRegressor
-from sklearn.model_selection import train_test_split
+from concurrent.futures import ThreadPoolExecutor
+from threadpoolctl import threadpool_limits
+import math
 import os
-import pathlib
+from typing import List, NamedTuple
 
-# Define all variables that will be predicted. 
+# Define all variables that will be predicted.
 # These will also be excluded from features X when training for any specific target.
 TARGET_VARIABLES = ['temp', 'rhum', 'prcp', 'wspd', 'wdir_sin', 'wdir_cos']
 RAW_WIND_DIR_COL = 'wdir' # Raw wind direction, also to be excluded from features X
+VALIDATION_FRACTION = 0.2 # Last 20% of each target's rows (in time order) are held out for the R² check
 
-def train():
-    # Create the directory for models if it doesn't exist
-    model_dir = pathlib.Path(__file__).parent / "models"
-    os.makedirs(model_dir, exist_ok=True)
+# Hyperparameters shared by every target model
+MODEL_PARAMS = {"loss": "squared_error"}
 
-    df_full = pd.read_sql("SELECT * FROM hourly", sqlite3.connect(DB), parse_dates=["time"], index_col="time")
-    print(f"Shape of df_full before make_features: {df_full.shape}")
-    
-    df_features = make_features(df_full)
-    print(f"Shape of df_features after make_features: {df_features.shape}")
+# Incremental training (TRAIN_MODE=incremental, the default) keeps each target's last fully refitted model
+# frozen and refits a small residual model on the most recent INCREMENTAL_WINDOW_HOURS of origins.
+# A target is fully refitted instead once FULL_REFIT_DAYS have passed since its last full refit, or when
+# its error on the hours that arrived since the last run exceeds its full-refit validation RMSE by
+# more than DRIFT_THRESHOLD (0.25 = 25%). TRAIN_MODE=full always refits from scratch.
+TRAIN_MODE = os.environ.get("TRAIN_MODE", "incremental")
+INCREMENTAL_WINDOW_HOURS = int(os.environ.get("INCREMENTAL_WINDOW_HOURS", str(24 * 28)))
+FULL_REFIT_DAYS = float(os.environ.get("FULL_REFIT_DAYS", "7"))
+DRIFT_THRESHOLD = float(os.environ.get("DRIFT_THRESHOLD", "0.25"))
+RESIDUAL_PARAMS = {"loss": "squared_error", "max_iter": 50, "max_leaf_nodes": 15, "early_stopping": False}
+
+# Cap on stacked (origin, horizon) training rows; above it, each horizon keeps an equal share
+# of origins drawn uniformly at random (without replacement).
+# Full refits stream the history one snapshot partition at a time and keep a uniform sample of at most
+# this many rows, so their memory is bounded by it and the partition size, not by the length of the history.
+HORIZON_MAX_ROWS = int(os.environ.get("HORIZON_MAX_ROWS", "2000000"))
+
+# Number of targets fitted concurrently. 0 (the default) means one worker per target, capped at the CPU count.
+TRAIN_WORKERS = int(os.environ.get("TRAIN_WORKERS", "0"))
+
+class TrainResult(NamedTuple):
+    trained: List[str] # targets refitted (fully or incrementally) and saved
+    kept: List[str]    # requested targets that were not refitted but still have their previous model in the bundle
+
+def horizon_pairs(times, horizons=HORIZONS, max_rows=HORIZON_MAX_ROWS, seed=0):
+    """
+    Finds every (origin row, target row, horizon) where an observation exists exactly `horizon` hours
+    after the origin. Gaps in the history are respected because targets are looked up by time.
+    `max_rows=None` keeps every pair. Returns the three arrays sorted by origin time, then horizon.
+    """
+    t = to_epoch(times)
+    rng = np.random.default_rng(seed)
+    per_horizon = max(1, max_rows // len(horizons)) if max_rows is not None else None
+    origin_idx, target_idx, horizon = [], [], []
+    for h in horizons:
+        j = np.searchsorted(t, t + h * 3600)
+        i = np.flatnonzero(j < len(t))
+        i = i[t[j[i]] == t[i] + h * 3600]
+        if per_horizon is not None and len(i) > per_horizon:
+            i = np.sort(rng.choice(i, per_horizon, replace=False))
+        origin_idx.append(i)
+        target_idx.append(j[i])
+        horizon.append(np.full(len(i), h))
+    origin_idx, target_idx, horizon = (np.concatenate(a) for a in (origin_idx, target_idx, horizon))
+    order = np.lexsort((horizon, origin_idx))
+    return origin_idx[order], target_idx[order], horizon[order]
+
+def _rmse(y, pred):
+    valid = ~np.isnan(y)
+    if not valid.any():
+        return None
+    return float(np.sqrt(np.mean((pred[valid] - y[valid]) ** 2)))
+
+def _fit_target(target_var, X, y):
+    # Rows where this target is NaN are masked out. When the target is complete (the common case)
+    # X is used as-is, so no per-target copy of the feature matrix is made.
+    valid = ~np.isnan(y)
+    rows_removed = int((~valid).sum())
+    if rows_removed:
+        rows = np.flatnonzero(valid)
+        X_target, y_target = X[rows], y[rows]
+    else:
+        X_target, y_target = X, y
+    print(f"Rows for {target_var} after dropping its NaNs: {len(y_target)}. Rows removed: {rows_removed}")
+
+    if len(y_target) == 0:
+        print(f"No rows left for {target_var} after dropping its NaNs. Skipping training.")
+        return None
+
+    # Same split as train_test_split(test_size=0.2, shuffle=False), but as views instead of copies
+    n_val = math.ceil(len(y_target) * VALIDATION_FRACTION)
+    n_train = len(y_target) - n_val
+    if n_train == 0 or n_val == 0:
+        print(f"Training or validation set is empty for {target_var} after split. Min samples for split might not be met. Skipping.")
+        return None
+
+    # Models are fitted on the bare arrays; the column order lives once in the model bundle
+    model = HistGradientBoostingRegressor(**MODEL_PARAMS)
+    with span("train.fit", target=target_var, rows=n_train):
+        model.fit(X_target[:n_train], y_target[:n_train])
+
+    with span("train.score", target=target_var, rows=n_val):
+        val_pred = model.predict(X_target[n_train:])
+    y_val = y_target[n_train:]
+    score = 1 - np.sum((y_val - val_pred) ** 2) / np.sum((y_val - y_val.mean()) ** 2)
+    print(f"Validation R² for {target_var}: {score}")
+    return model, {
+        "validation_r2": float(score),
+        "validation_rmse": _rmse(y_val, val_pred),
+        "n_train": int(n_train),
+        "n_val": int(n_val),
+    }
+
+def _fit_residual(target_var, base, X, y):
+    # The base model stays as it is; only its errors on the recent window are learned
+    valid = ~np.isnan(y)
+    X_target, y_target = (X, y) if valid.all() else (X[valid], y[valid])
+    if len(y_target) == 0:
+        print(f"No recent rows for {target_var}. Skipping incremental update.")
+        return None
+    with span("train.fit_residual", target=target_var, rows=len(y_target)):
+        residual = HistGradientBoostingRegressor(**RESIDUAL_PARAMS)
+        residual.fit(X_target, y_target - base.predict(X_target))
+    return ResidualModel(base, residual), {"n_train": int(len(y_target))}
+
+def build_matrix(df_features, feature_names, origin_idx, horizon, out=None):
+    # One compact float32 matrix shared read-only by all targets.
+    # `out` may be a preallocated (e.g. memory-mapped) float32 array of the right shape to fill instead.
+    n_origin = len(feature_names)
+    with span("train.build_matrix", rows=len(origin_idx)):
+        X = out if out is not None else np.empty((len(origin_idx), n_origin + len(HORIZON_FEATURES)), dtype=np.float32)
+        X[:, :n_origin] = df_features[feature_names].to_numpy(dtype=np.float32)[origin_idx]
+        X[:, n_origin:] = horizon_features(df_features.index[origin_idx], horizon)
+    return X
+
+def _fit_all(fit, jobs, workers):
+    # jobs: {target: args for fit(target, *args)}
+    workers = workers or TRAIN_WORKERS or min(len(jobs), os.cpu_count() or 1)
+    workers = max(1, min(workers, len(jobs)))
+    # Split the CPU between the concurrent fits instead of letting each one spawn a full OpenMP team
+    threads_per_model = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Training {len(jobs)} targets with {workers} worker(s), {threads_per_model} thread(s) each")
+    with threadpool_limits(limits=threads_per_model, user_api="openmp"):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {target_var: pool.submit(fit, target_var, *args) for target_var, args in jobs.items()}
+            return {target_var: future.result() for target_var, future in futures.items()}
+
+def _plan(selected, existing, mode, recent):
+    """
+    Decides per target whether to refit fully or update incrementally, and why. `recent` holds the
+    window matrix and, per target, the rows whose target hour arrived after that target was last
+    trained; the current model's error on those rows is the out-of-sample drift check.
+    """
+    now = pd.Timestamp.now(tz="UTC")
+    plan, checks = {}, {}
+    for target_var in selected:
+        info = existing["metadata"].get("targets", {}).get(target_var, {}) if existing is not None else {}
+        full_refit_at = info.get("full_refit_at")
+        if mode == "full":
+            plan[target_var] = ("full", "TRAIN_MODE=full")
+        elif existing is None or target_var not in existing["models"]:
+            plan[target_var] = ("full", "no previous model")
+        elif full_refit_at is None or now - pd.Timestamp(full_refit_at) >= pd.Timedelta(days=FULL_REFIT_DAYS):
+            plan[target_var] = ("full", f"last full refit more than {FULL_REFIT_DAYS:g} days ago")
+        else:
+            X_recent, new_rows, y_recent = recent[0], recent[1][target_var], recent[2][target_var]
+            rmse = _rmse(y_recent[new_rows], existing["models"][target_var].predict(X_recent[new_rows])) \
+                if len(new_rows) else None
+            baseline = info.get("baseline_rmse")
+            drift = rmse / baseline if rmse is not None and baseline else None
+            checks[target_var] = {"recent_rmse": rmse, "baseline_rmse": baseline, "drift": drift, "new_rows": int(len(new_rows))}
+            if drift is not None and drift > 1 + DRIFT_THRESHOLD:
+                plan[target_var] = ("full", f"drift {drift:.2f}x over the full-refit validation RMSE")
+            else:
+                plan[target_var] = ("incremental", "within schedule and drift threshold")
+    return plan, checks
+
+def sync_training_snapshot(station=DEFAULT_STATION.id):
+    """
+    Brings the feature store and its snapshot up to date. Returns the snapshot columns training
+    reads (targets included) and the names of the origin feature columns among them.
+    """
+    # Features are maintained incrementally in the feature store; only newly appended hours are computed here.
+    # Training then reads them from the memory-mapped columnar snapshot instead of through SQL.
+    conn = connect(DB)
+    update_feature_store(conn)
+    sync_snapshot(conn, "features", station)
+    conn.close()
 
     # Columns to exclude from the feature set X for any model.
     # This includes all target variables and the original wind direction column.
     cols_to_drop_for_X = TARGET_VARIABLES + [RAW_WIND_DIR_COL]
-    # Ensure we only try to drop columns that actually exist in df_features
-    cols_to_drop_for_X = [col for col in cols_to_drop_for_X if col in df_features.columns]
+    # Only the columns training needs are materialized from the snapshot
+    columns = [c for c in snapshot_columns("features", station) or [] if c != RAW_WIND_DIR_COL]
+    feature_names = [col for col in columns if col not in cols_to_drop_for_X]
+    return columns, feature_names
 
-    for target_var in TARGET_VARIABLES:
-        print(f"\n--- Training model for {target_var} ---")
-        df_target = df_features.copy() # Use a copy for each target
+def _trained_until(existing, target_var):
+    # Last hour a target's model was trained on. Partial retrains move the bundle's time range
+    # for every target, so each target's own range is used; bundles without one fall back to it.
+    info = existing["metadata"].get("targets", {}).get(target_var, {})
+    return (info.get("time_range") or existing["metadata"].get("time_range") or [None, None])[1]
 
-        # Check if the target variable itself exists in the dataframe
-        if target_var not in df_target.columns:
-            print(f"Target variable {target_var} not found in DataFrame. Skipping training for this target.")
-            continue
-            
-        # Remove rows where the current target variable is NaN
-        initial_rows = df_target.shape[0]
-        df_target.dropna(subset=[target_var], inplace=True)
-        rows_removed = initial_rows - df_target.shape[0]
-        print(f"Shape of df_target for {target_var} after dropping its NaNs: {df_target.shape}. Rows removed: {rows_removed}")
-
-        if df_target.empty:
-            print(f"DataFrame is empty for {target_var} after dropping its NaNs. Skipping training.")
-            continue
+def sample_training_set(station, columns, feature_names, targets, max_rows=HORIZON_MAX_ROWS, seed=0):
+    """
+    Builds the direct multi-horizon training set from the feature snapshot one year partition at a time.
+    The last max(HORIZONS) hours of each partition are carried into the next, so pairs crossing a
+    partition boundary are kept. Each horizon keeps a uniform reservoir sample of max_rows / len(HORIZONS)
+    pairs (the ones with the smallest random keys), and matrix rows are only built for pairs that can
+    still enter it. Returns X, {target: y} and the target times (epoch seconds) in horizon_pairs order,
+    or None if the history has no pairs.
+    """
+    rng = np.random.default_rng(seed)
+    per_horizon = max(1, max_rows // len(HORIZONS))
+    n_features = len(feature_names) + len(HORIZON_FEATURES)
+    # Per horizon: random keys, origin times, target times, matrix rows and target values
+    empty = lambda: (np.empty(0), np.empty(0, np.int64), np.empty(0, np.int64),
+                     np.empty((0, n_features), np.float32), np.empty((0, len(targets))))
+    reservoir = {h: empty() for h in HORIZONS}
+    tail = None
+    with span("train.sample", station=station) as record:
+        for chunk in iter_snapshot("features", station, columns=columns):
+            df = chunk if tail is None else pd.concat([tail, chunk])
+            origin_idx, target_idx, horizon = horizon_pairs(df.index, max_rows=None)
+            # Pairs whose target falls in the carried tail were already seen with the previous partition
+            new = target_idx >= (0 if tail is None else len(tail))
+            origin_idx, target_idx, horizon = origin_idx[new], target_idx[new], horizon[new]
+            keys = rng.random(len(origin_idx))
+            # Only pairs that beat the largest key of a full reservoir can enter it
+            cutoff = np.array([r[0].max() if len(r[0]) >= per_horizon else np.inf for r in reservoir.values()])
+            keep = keys < cutoff[horizon - HORIZONS[0]]
+            origin_idx, target_idx, horizon, keys = origin_idx[keep], target_idx[keep], horizon[keep], keys[keep]
 
-        X = df_target.drop(columns=cols_to_drop_for_X, errors='ignore') # errors='ignore' is belt-and-suspenders
-        y = df_target[target_var]
-        
-        # Check if X is empty (e.g. if all columns were target columns or dropped)
-        if X.empty:
-            print(f"Feature set X is empty for {target_var}. Skipping training.")
-            continue
-            
-        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, shuffle=False)
+            X = build_matrix(df, feature_names, origin_idx, horizon)
+            y = df[targets].to_numpy(dtype=np.float64)[target_idx]
+            t = to_epoch(df.index)
+            for h in np.unique(horizon):
+                rows = np.flatnonzero(horizon == h)
+                parts = (keys[rows], t[origin_idx[rows]], t[target_idx[rows]], X[rows], y[rows])
+                merged = [np.concatenate([old, part]) for old, part in zip(reservoir[h], parts)]
+                if len(merged[0]) > per_horizon:
+                    smallest = np.argpartition(merged[0], per_horizon - 1)[:per_horizon]
+                    merged = [a[smallest] for a in merged]
+                reservoir[h] = tuple(merged)
+            del X, y
+            tail = df[df.index > df.index[-1] - pd.Timedelta(hours=max(HORIZONS))]
+
+        # Sorted into horizon_pairs order by scattering each horizon's rows straight into place,
+        # so the matrix exists at most twice (reservoir and result) while it is assembled
+        origin_t, target_t = (np.concatenate([r[i] for r in reservoir.values()]) for i in (1, 2))
+        horizon = np.concatenate([np.full(len(r[0]), h) for h, r in reservoir.items()])
+        order = np.lexsort((horizon, origin_t))
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+        X = np.empty((len(order), n_features), dtype=np.float32)
+        y = np.empty((len(targets), len(order)))
+        start = 0
+        for h in HORIZONS:
+            _, _, _, X_h, y_h = reservoir.pop(h)
+            rows = position[start:start + len(X_h)]
+            X[rows], y[:, rows] = X_h, y_h.T
+            start += len(X_h)
+        record["rows"] = len(order)
+    if not len(order):
+        return None
+    return X, dict(zip(targets, y)), target_t[order]
+
+@traced("train")
+def train(workers=None, station=DEFAULT_STATION.id, targets=None, mode=None, compare_full=False):
+    """
+    Fits the target models and saves them as one bundle. With `targets`, only those models are refitted
+    and merged into the existing bundle; the others are kept as they are. In incremental mode (see
+    TRAIN_MODE) most days only refit small residual models on recent hours. `compare_full` additionally
+    fits a from-scratch model for each incrementally updated target and reports both errors on the
+    newest hours, to measure what incremental training costs in accuracy. Returns a TrainResult: the
+    targets that were trained, and the requested ones that were skipped (e.g. no valid recent rows)
+    but keep their previous model.
+    """
+    mode = mode or TRAIN_MODE
+    columns, feature_names = sync_training_snapshot(station)
+    bounds = snapshot_bounds("features", station)
+    if bounds is None:
+        print("No feature data available. Skipping training.")
+        return TrainResult([], [])
+
+    if not feature_names:
+        print("Feature set X is empty. Skipping training.")
+        return TrainResult([], [])
+    available = [t for t in TARGET_VARIABLES if t in columns]
+    for target_var in set(TARGET_VARIABLES) - set(available):
+        print(f"Target variable {target_var} not found in DataFrame. Skipping training for this target.")
+    bundle_features = feature_names + HORIZON_FEATURES
+    time_range = [bounds[0].isoformat(), bounds[1].isoformat()]
+
+    # Partial retrains and incremental updates only work if the models in the bundle expect the same input columns
+    existing = None
+    if BUNDLE_PATH.exists() and (targets is not None or mode == "incremental"):
+        existing = load_bundle(BUNDLE_PATH)
+        if existing["feature_names"] != bundle_features or existing["metadata"].get("horizons") != HORIZONS:
+            print("Existing model bundle was trained on a different feature set. Retraining every target.")
+            existing = None
+    elif targets is not None:
+        print("No existing model bundle to update. Retraining every target.")
+    selected = [t for t in available if targets is None or existing is None or t in targets]
+    kept_models = existing["models"] if existing is not None else {}
+    kept = lambda trained: [t for t in (targets or TARGET_VARIABLES) if t not in trained and t in kept_models]
+    if not selected:
+        print("None of the requested targets are available. Skipping training.")
+        return TrainResult([], kept([]))
+
+    # Direct multi-horizon training set: the features at each origin hour, the horizon and the
+    # valid-time encodings, paired with each target's value `horizon` hours later.
+    # The recent window (for residual fits and drift checks) only covers the last INCREMENTAL_WINDOW_HOURS,
+    # so only the partitions it spans are read.
+    recent = None
+    trained_until = {t: _trained_until(existing, t) for t in selected} if existing is not None else {}
+    if existing is not None and mode == "incremental":
+        window_start = bounds[1] - pd.Timedelta(hours=INCREMENTAL_WINDOW_HOURS)
+        df_recent = read_snapshot("features", station, columns=columns, start=window_start)
+        r_origin, r_target, r_horizon = horizon_pairs(df_recent.index)
+        X_recent = build_matrix(df_recent, feature_names, r_origin, r_horizon)
+        r_target_times = df_recent.index[r_target]
+        new_rows = {t: np.flatnonzero(r_target_times > pd.Timestamp(trained_until[t])) if trained_until[t] else np.arange(0)
+                    for t in selected}
+        y_recent = {t: df_recent[t].to_numpy(dtype=np.float64)[r_target] for t in selected}
+        recent = (X_recent, new_rows, y_recent)
+    plan, checks = _plan(selected, existing, mode, recent)
+    full_targets = [t for t in selected if plan[t][0] == "full"]
+    incremental_targets = [t for t in selected if plan[t][0] == "incremental"]
+    for target_var in selected:
+        print(f"{target_var}: {plan[target_var][0]} ({plan[target_var][1]})")
+
+    results, X, target_arrays = {}, None, {}
+    if full_targets or compare_full:
+        sample = sample_training_set(station, columns, feature_names, available)
+        if sample is None:
+            print("Not enough consecutive hours to build horizon training pairs. Skipping training.")
+            return TrainResult([], kept([]))
+        X, target_arrays, target_times = sample
+        print(f"Shared feature matrix: {X.shape} ({len(HORIZONS)} horizons), {X.nbytes / 1e6:.1f} MB")
+        if full_targets:
+            results.update(_fit_all(_fit_target, {t: (X, target_arrays[t]) for t in full_targets}, workers))
+    if incremental_targets:
+        X_recent, _, y_recent = recent
+        print(f"Recent window matrix: {X_recent.shape}, {X_recent.nbytes / 1e6:.1f} MB")
+        jobs = {t: (getattr(existing["models"][t], "base", existing["models"][t]), X_recent, y_recent[t])
+                for t in incremental_targets}
+        results.update(_fit_all(_fit_residual, jobs, workers))
+
+    if compare_full and incremental_targets:
+        _compare_full(incremental_targets, existing, recent, X, target_times, target_arrays, trained_until, checks)
+
+    trained = {t: r for t, r in results.items() if r is not None}
+    if not trained:
+        print("No models were trained. Keeping the existing model bundle.")
+        return TrainResult([], kept([]))
+
+    models = dict(kept_models)
+    target_info = dict(existing["metadata"].get("targets", {})) if existing is not None else {}
+    now = pd.Timestamp.now(tz="UTC").isoformat()
+    for target_var, (model, info) in trained.items():
+        models[target_var] = model
+        kind, reason = plan[target_var]
+        info = {**info, **checks.get(target_var, {}), "mode": kind, "reason": reason, "time_range": time_range}
+        if kind == "full":
+            # The validation RMSE of a full refit is what later incremental updates are compared against
+            info.update(full_refit_at=now, baseline_rmse=info["validation_rmse"])
+        else:
+            previous = target_info.get(target_var, {})
+            info.update(full_refit_at=previous.get("full_refit_at"), baseline_rmse=previous.get("baseline_rmse"))
+        target_info[target_var] = info
+    _print_report(trained, target_info)
+
+    metadata = {
+        "station": station,
+        "n_rows": int(X.shape[0]) if X is not None else int(recent[0].shape[0]),
+        "horizons": HORIZONS,
+        "time_range": time_range,
+        "targets": target_info,
+        "model_params": MODEL_PARAMS,
+        "residual_params": RESIDUAL_PARAMS,
+        "sklearn_version": sklearn.__version__,
+    }
+    fingerprint = data_hash(X, target_arrays) if X is not None else data_hash(recent[0], recent[2])
+    with span("train.save_bundle", targets=len(models)):
+        bundle = save_bundle(models, bundle_features, metadata=metadata, data_hash=fingerprint)
+    # Flat-array copy of the trees, so predict.py and serve.py can start without scikit-learn
+    with span("train.export_trees"):
+        export_bundle(bundle)
+    print(f"Saved model bundle with {len(models)} targets ({len(trained)} retrained) to {BUNDLE_PATH}")
+    return TrainResult(list(trained), kept(trained))
 
-        if X_train.empty or X_val.empty:
-            print(f"Training or validation set is empty for {target_var} after split. Min samples for split might not be met. Skipping.")
+def _compare_full(targets, existing, recent, X, target_times, target_arrays, trained_until, checks):
+    # Fits a from-scratch model on the same hours each current model had seen (targets up to its
+    # trained_until) and scores both on the hours that arrived since: the accuracy incremental training gives up
+    X_recent, new_rows, y_recent = recent
+    targets = [t for t in targets if len(new_rows[t])]
+    if not targets:
+        print("No new hours since the last training run. Nothing to compare.")
+        return
+    # Targets last trained up to the same hour share one copy of the rows they had seen
+    seen, jobs = {}, {}
+    for target_var in targets:
+        until = trained_until[target_var]
+        if until not in seen:
+            rows = np.flatnonzero(target_times <= time_key(until))
+            seen[until] = (rows, X[rows])
+        rows, X_seen = seen[until]
+        jobs[target_var] = (X_seen, target_arrays[target_var][rows])
+    fitted = _fit_all(_fit_target, jobs, None)
+    for target_var, result in fitted.items():
+        if result is None:
             continue
+        rows = new_rows[target_var]
+        checks[target_var]["full_refit_rmse"] = _rmse(y_recent[target_var][rows], result[0].predict(X_recent[rows]))
 
-        model = HistGradientBoostingRegressor(loss="squared_error")
-        model.fit(X_train, y_train)
-        
-        score = model.score(X_val, y_val)
-        print(f"Validation R² for {target_var}: {score}")
-        
-        model_filename = model_dir / f"model_{target_var}.joblib"
-        joblib.dump(model, model_filename)
-        print(f"Saved model for {target_var} to {model_filename}")
+def _print_report(trained, target_info):
+    print("Training report (recent = error of the previous model on hours that arrived since the last run):")
+    for target_var in trained:
+        info = target_info[target_var]
+        parts = [f"{target_var:<9} {info['mode']:<11}"]
+        for key in ("validation_rmse", "recent_rmse", "baseline_rmse", "full_refit_rmse"):
+            if info.get(key) is not None:
+                parts.append(f"{key}={info[key]:.4f}")
+        if info.get("drift") is not None:
+            parts.append(f"drift={info['drift']:.2f}x")
+        print("  " + "  ".join(parts))
 
 if __name__ == "__main__":
-    train() 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the target models.")
+    parser.add_argument("--mode", choices=["full", "incremental"], default=None)
+    parser.add_argument("--target", action="append", choices=TARGET_VARIABLES)
+    parser.add_argument("--compare-full", action="store_true",
+                        help="also fit from-scratch models and report the accuracy difference")
+    args = parser.parse_args()
+    train(targets=args.target, mode=args.mode, compare_full=args.compare_full)
@@ -0,0 +1,200 @@
+"""
+Exports the models in the bundle to flat NumPy arrays and evaluates them without scikit-learn.
+
+Unpickling the bundle imports sklearn and rebuilds every estimator, which dominates the cold start
+of predict.py and serve.py. The fitted trees only need a handful of arrays per node (split feature,
+raw-valued threshold, missing-value direction, children, leaf value), so train.py writes those to
+models/trees.npz next to the bundle. Loading it takes milliseconds and needs nothing but numpy.
+
+The evaluator is faster than model.predict on a single forecast (24 rows) but two to three times
+slower on large batches, so it is meant for cold starts: predict.py uses it, and serve.py only
+answers from it until the full bundle has been loaded in the background.
+
+    python tree_export.py            # export the current bundle and check it against model.predict
+"""
+import json
+import os
+import pathlib
+import numpy as np
+from fileio import write_atomic
+
+# Same locations as in model_bundle.py, repeated so this module doesn't pull in joblib
+MODEL_DIR = pathlib.Path(__file__).parent / "models"
+BUNDLE_PATH = MODEL_DIR / "bundle.joblib"
+TREES_PATH = MODEL_DIR / "trees.npz"
+
+TREES_VERSION = 1
+_FIELDS = ("feature", "threshold", "missing_left", "left", "right", "value", "roots")
+_LINKS = {"IdentityLink": "identity", "LogLink": "log"}
+PREDICT_CHUNK_ROWS = 4096 # rows evaluated at once; bounds the (rows x trees) node index array
+
+class TreeEnsemble:
+    """
+    All trees of one model as flat node arrays, with leaves pointing to themselves. Every row walks
+    every tree at once, and each step only advances the (row, tree) pairs that have not reached a
+    leaf yet. predict() matches HistGradientBoostingRegressor.predict up to floating point summation order.
+    """
+    def __init__(self, feature, threshold, missing_left, left, right, value, roots, baseline=0.0, link="identity"):
+        self.feature = feature
+        self.threshold = threshold
+        self.missing_left = missing_left
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.baseline = float(baseline)
+        self.link = link
+
+    @classmethod
+    def concat(cls, ensembles):
+        # Sum of several identity-link ensembles as one, e.g. the base and residual of a ResidualModel
+        if any(e.link != "identity" for e in ensembles):
+            raise ValueError("Only identity-link models can be combined.")
+        offsets = np.cumsum([0] + [len(e.value) for e in ensembles[:-1]])
+        return cls(
+            np.concatenate([e.feature for e in ensembles]),
+            np.concatenate([e.threshold for e in ensembles]),
+            np.concatenate([e.missing_left for e in ensembles]),
+            np.concatenate([e.left + o for e, o in zip(ensembles, offsets)]),
+            np.concatenate([e.right + o for e, o in zip(ensembles, offsets)]),
+            np.concatenate([e.value for e in ensembles]),
+            np.concatenate([e.roots + o for e, o in zip(ensembles, offsets)]),
+            baseline=sum(e.baseline for e in ensembles),
+        )
+
+    def raw_predict(self, X):
+        X = np.asarray(X, dtype=np.float64) # sklearn compares in float64 too
+        n_trees = len(self.roots)
+        out = np.empty(len(X))
+        for start in range(0, len(X), PREDICT_CHUNK_ROWS):
+            chunk = X[start:start + PREDICT_CHUNK_ROWS]
+            # Current node of every (row, tree) pair, row-major; `active` indexes the pairs still in a split node
+            node = np.tile(self.roots, len(chunk))
+            active = np.flatnonzero(self.left[node] != node)
+            while active.size:
+                current = node[active]
+                x = chunk[active // n_trees, self.feature[current]]
+                go_left = np.where(np.isnan(x), self.missing_left[current], x <= self.threshold[current])
+                current = np.where(go_left, self.left[current], self.right[current])
+                node[active] = current
+                active = active[self.left[current] != current]
+            out[start:start + len(chunk)] = self.baseline + self.value[node].reshape(len(chunk), n_trees).sum(axis=1)
+        return out
+
+    def predict(self, X):
+        raw = self.raw_predict(X)
+        return np.exp(raw) if self.link == "log" else raw
+
+def export_model(model) -> TreeEnsemble:
+    """
+    Flattens a fitted HistGradientBoostingRegressor (or a ResidualModel of two) into a TreeEnsemble.
+    Reads the estimator's fitted trees directly, so the layout follows scikit-learn's TreePredictor nodes.
+    """
+    if hasattr(model, "base") and hasattr(model, "residual"):
+        return TreeEnsemble.concat([export_model(model.base), export_model(model.residual)])
+    if getattr(model, "n_trees_per_iteration_", 1) != 1:
+        raise ValueError("Only single-output regressors can be exported.")
+    if getattr(model, "is_categorical_", None) is not None and np.any(model.is_categorical_):
+        raise ValueError("Models with categorical features cannot be exported.")
+    link = _LINKS.get(type(model._loss.link).__name__)
+    if link is None:
+        raise ValueError(f"Unsupported link function {type(model._loss.link).__name__}.")
+
+    parts, roots, offset = [], [], 0
+    for (predictor,) in model._predictors:
+        nodes = predictor.nodes
+        own = np.arange(len(nodes)) + offset
+        is_leaf = nodes["is_leaf"].astype(bool)
+        parts.append((
+            np.where(is_leaf, 0, nodes["feature_idx"]),
+            np.where(is_leaf, np.inf, nodes["num_threshold"]),
+            nodes["missing_go_to_left"].astype(bool),
+            np.where(is_leaf, own, nodes["left"].astype(np.int64) + offset),
+            np.where(is_leaf, own, nodes["right"].astype(np.int64) + offset),
+            np.where(is_leaf, nodes["value"], 0.0),
+        ))
+        roots.append(offset)
+        offset += len(nodes)
+    feature, threshold, missing_left, left, right, value = (np.concatenate(a) for a in zip(*parts))
+    return TreeEnsemble(
+        feature.astype(np.int32), threshold.astype(np.float64), missing_left,
+        left.astype(np.int32), right.astype(np.int32), value.astype(np.float64),
+        np.array(roots, dtype=np.int32), baseline=float(np.ravel(model._baseline_prediction)[0]), link=link,
+    )
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def export_bundle(bundle, path=TREES_PATH, bundle_path=BUNDLE_PATH):
+    """
+    Writes every model of a loaded bundle to one .npz file, tagged with the bundle file it came from
+    so load_trees() can tell when the bundle has been retrained since.
+    """
+    arrays = {}
+    models = {}
+    for target_var, model in bundle["models"].items():
+        ensemble = export_model(model)
+        for field in _FIELDS:
+            arrays[f"{target_var}.{field}"] = getattr(ensemble, field)
+        models[target_var] = {"baseline": ensemble.baseline, "link": ensemble.link}
+    meta = {
+        "version": TREES_VERSION,
+        "bundle": _stat_key(bundle_path),
+        "models": models,
+        "feature_names": bundle["feature_names"],
+        "metadata": bundle["metadata"],
+        "data_hash": bundle.get("data_hash"),
+    }
+    arrays["meta"] = np.array(json.dumps(meta, default=str))
+    def write(tmp_path):
+        # Through a file object: np.savez would append .npz to the temporary name
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+    return write_atomic(path, write)
+
+def load_trees(path=TREES_PATH, bundle_path=BUNDLE_PATH):
+    """
+    Loads the exported models in the same shape as model_bundle.load_bundle(), with TreeEnsembles as
+    models. Returns None if there is no export or it is older than the bundle, so callers can fall back.
+    """
+    try:
+        bundle_key = _stat_key(bundle_path)
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != TREES_VERSION or meta.get("bundle") != bundle_key:
+                return None
+            models = {
+                target_var: TreeEnsemble(*(data[f"{target_var}.{field}"] for field in _FIELDS), **info)
+                for target_var, info in meta["models"].items()
+            }
+    except FileNotFoundError:
+        return None
+    return {"models": models, "feature_names": meta["feature_names"], "metadata": meta["metadata"],
+            "data_hash": meta["data_hash"]}
+
+def load_models(bundle_path=BUNDLE_PATH, trees_path=TREES_PATH):
+    """
+    The exported trees when they are current, otherwise the full bundle (which imports scikit-learn).
+    """
+    trees = load_trees(trees_path, bundle_path)
+    if trees is not None:
+        return trees
+    from model_bundle import load_bundle
+    return load_bundle(bundle_path)
+
+def check_export(bundle, trees, rows=2000, seed=0):
+    # Largest absolute difference per target between model.predict and the exported trees on random inputs
+    rng = np.random.default_rng(seed)
+    X = rng.normal(scale=10.0, size=(rows, len(bundle["feature_names"])))
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return {t: float(np.max(np.abs(model.predict(X) - trees["models"][t].predict(X))))
+            for t, model in bundle["models"].items()}
+
+if __name__ == "__main__":
+    from model_bundle import load_bundle
+    bundle = load_bundle(BUNDLE_PATH)
+    export_bundle(bundle)
+    print(f"Exported {len(bundle['models'])} models to {TREES_PATH}")
+    for target_var, diff in check_export(bundle, load_trees()).items():
+        print(f"  {target_var:<9} max |sklearn - export| = {diff:.3g}")
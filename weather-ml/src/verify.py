@@ -0,0 +1,238 @@
+"""
+Scores the archived forecasts against the observations that have arrived since.
+
+Each target's forecasts are read from the archive in one query and joined in NumPy to the observations
+at their valid hour and, as the persistence reference, at their origin hour. They are then scored with
+array operations: MAE, RMSE and bias overall and per lead time, the skill score 1 - MSE / MSE(persistence),
+and a rolling RMSE and skill over the last `window_days` days of valid times.
+
+    python verify.py                  # everything archived so far
+    python verify.py --days 90 --window-days 7
+"""
+import argparse
+import json
+import pathlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from db import connect, table_exists, time_key, from_epoch
+from forecast_archive import ARCHIVE_TABLE, ARCHIVE_TARGETS, ensure_archive
+from instrument import span, traced
+from fileio import write_text_atomic
+from stations import DEFAULT_STATION
+
+DB_PATH = pathlib.Path(__file__).parent.parent / 'weather.sqlite'
+VERIFICATION_PATH = pathlib.Path(__file__).parent.parent / "data" / "verification.json"
+WINDOW_DAYS = 30
+MAX_LEAD = 24
+
+# Observed counterpart of each target: an hourly column and how to derive the target from it
+OBSERVED = {
+    'temp': ('temp', None),
+    'rhum': ('rhum', None),
+    'prcp': ('prcp', None),
+    'wspd': ('wspd', None),
+    'wdir_sin': ('wdir', lambda deg: np.sin(np.radians(deg))),
+    'wdir_cos': ('wdir', lambda deg: np.cos(np.radians(deg))),
+}
+WIND_COMPONENTS = ("wdir_sin", "wdir_cos")
+
+def angular_error(sin_pred, cos_pred, sin_true, cos_true):
+    """
+    Signed difference in degrees (-180..180] between the forecast and observed wind direction.
+    """
+    pred = np.degrees(np.arctan2(sin_pred, cos_pred))
+    true = np.degrees(np.arctan2(sin_true, cos_true))
+    return (pred - true + 180) % 360 - 180
+
+def load_archive(conn, station_id, target_var, start=None, end=None):
+    """
+    Archived forecasts of one target as arrays: run_time, valid_time (epoch seconds) and forecast.
+    A range scan of the archive's (station, target, valid_time, ...) primary key.
+    """
+    clauses, params = ["station = ?", "target = ?"], [station_id, ARCHIVE_TARGETS.index(target_var)]
+    if start is not None:
+        clauses.append("valid_time >= ?")
+        params.append(time_key(start))
+    if end is not None:
+        clauses.append("valid_time <= ?")
+        params.append(time_key(end))
+    rows = conn.execute(f"""
+        SELECT run_time, valid_time, value FROM {ARCHIVE_TABLE}
+        WHERE {' AND '.join(clauses)}
+    """, params).fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    return {"run_time": data[:, 0].astype(np.int64), "valid_time": data[:, 1].astype(np.int64), "forecast": data[:, 2]}
+
+def load_observations(conn, station_id, start, end, columns):
+    # Hourly observations between two epoch seconds: sorted times plus one float64 array per column
+    col_list = ", ".join(f'"{c}"' for c in columns)
+    rows = conn.execute(f"SELECT time, {col_list} FROM hourly WHERE station = ? AND time BETWEEN ? AND ? ORDER BY time",
+                        (station_id, int(start), int(end))).fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(-1, len(columns) + 1)
+    return data[:, 0].astype(np.int64), {c: data[:, i + 1] for i, c in enumerate(columns)}
+
+def lookup(times, values, at):
+    """
+    values at the hours `at`, NaN where `times` (sorted) has no row for that hour.
+    """
+    if not len(times):
+        return np.full(len(at), np.nan)
+    idx = np.minimum(np.searchsorted(times, at), len(times) - 1)
+    return np.where(times[idx] == at, values[idx], np.nan)
+
+def load_pairs(conn, station_id, targets=ARCHIVE_TARGETS, start=None, end=None):
+    """
+    Every archived forecast of `targets` with the observation at its valid hour and, as the
+    persistence reference, at its origin hour (NaN where not observed). The join is done in NumPy
+    against one range read of `hourly`, rather than as two index lookups per archived row in SQL.
+    """
+    archived = {t: load_archive(conn, station_id, t, start, end) for t in targets}
+    times = [a[k] for a in archived.values() for k in ("run_time", "valid_time") if len(a[k])]
+    if not times:
+        return {}
+    columns = sorted({OBSERVED[t][0] for t in targets})
+    obs_times, obs = load_observations(conn, station_id, min(t.min() for t in times), max(t.max() for t in times), columns)
+    pairs = {}
+    for target_var, a in archived.items():
+        column, derive = OBSERVED[target_var]
+        observed = lookup(obs_times, obs[column], a["valid_time"])
+        persistence = lookup(obs_times, obs[column], a["run_time"])
+        if derive is not None:
+            observed, persistence = derive(observed), derive(persistence)
+        pairs[target_var] = {**a, "observed": observed, "persistence": persistence}
+    return pairs
+
+def _round(values):
+    return [None if np.isnan(v) else round(float(v), 4) for v in np.atleast_1d(values)]
+
+def _skill(mse, reference_mse):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 1 - mse / reference_mse
+
+def score(err, reference_err, lead, valid_time, window_days=WINDOW_DAYS):
+    """
+    Overall, per-lead and rolling scores of forecast errors `err` against the persistence errors
+    `reference_err` of the same rows. NaN errors (missing observations) are left out.
+    """
+    valid = ~np.isnan(err)
+    err, reference_err, lead, valid_time = err[valid], reference_err[valid], lead[valid], valid_time[valid]
+    if not len(err):
+        return {"n": 0}
+    # Skill only over rows where the persistence reference exists too
+    paired = ~np.isnan(reference_err)
+    sq, ref_sq = err ** 2, np.where(paired, reference_err ** 2, 0.0)
+    paired_sq = np.where(paired, sq, 0.0)
+
+    leads = np.arange(1, MAX_LEAD + 1)
+    idx = np.clip(lead, 1, MAX_LEAD) - 1
+    by_lead = lambda w: np.bincount(idx, weights=w, minlength=MAX_LEAD)
+    n_lead = by_lead(None)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        per_lead = {
+            "lead": leads.tolist(),
+            "n": n_lead.astype(int).tolist(),
+            "mae": _round(by_lead(np.abs(err)) / n_lead),
+            "rmse": _round(np.sqrt(by_lead(sq) / n_lead)),
+            "skill": _round(_skill(by_lead(paired_sq), by_lead(ref_sq))),
+        }
+
+    # Daily sums over valid days, then trailing window sums by differencing their cumulative sums
+    day = valid_time // 86400
+    first = day.min()
+    n_days = int(day.max() - first) + 1
+    daily = [np.bincount(day - first, weights=w, minlength=n_days)
+             for w in (None, sq, paired_sq, ref_sq)]
+    windowed = []
+    for d in daily:
+        c = np.concatenate([[0.0], np.cumsum(d)])
+        windowed.append(c[1:] - c[np.maximum(0, np.arange(1, n_days + 1) - window_days)])
+    w_n, w_sq, w_paired_sq, w_ref_sq = windowed
+    has_data = daily[0] > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rolling = {
+            "window_days": window_days,
+            "date": [d.strftime("%Y-%m-%d") for d in from_epoch((np.flatnonzero(has_data) + first) * 86400)],
+            "n": w_n[has_data].astype(int).tolist(),
+            "rmse": _round(np.sqrt(w_sq / w_n)[has_data]),
+            "skill": _round(_skill(w_paired_sq, w_ref_sq)[has_data]),
+        }
+
+    return {
+        "n": int(len(err)),
+        "mae": _round(np.abs(err).mean())[0],
+        "rmse": _round(np.sqrt(sq.mean()))[0],
+        "bias": _round(err.mean())[0],
+        "persistence_rmse": _round(np.sqrt(ref_sq.sum() / paired.sum()) if paired.any() else np.nan)[0],
+        "skill": _round(_skill(paired_sq.sum(), ref_sq.sum()))[0],
+        "per_lead": per_lead,
+        "rolling": rolling,
+    }
+
+def _wind_errors(pairs):
+    # Match the sin and cos rows of the same (run, valid hour) and score the angle between them
+    sin_p, cos_p = (pairs[c] for c in WIND_COMPONENTS)
+    key = lambda p: p["run_time"] * 100 + (p["valid_time"] - p["run_time"]) // 3600
+    _, i, j = np.intersect1d(key(sin_p), key(cos_p), return_indices=True)
+    err = angular_error(sin_p["forecast"][i], cos_p["forecast"][j], sin_p["observed"][i], cos_p["observed"][j])
+    reference_err = angular_error(sin_p["persistence"][i], cos_p["persistence"][j], sin_p["observed"][i], cos_p["observed"][j])
+    return err, reference_err, sin_p["run_time"][i], sin_p["valid_time"][i]
+
+@traced("verify")
+def verify(station=DEFAULT_STATION.id, start=None, end=None, window_days=WINDOW_DAYS, output=VERIFICATION_PATH):
+    conn = connect(DB_PATH)
+    try:
+        if not table_exists(conn, ARCHIVE_TABLE) or not table_exists(conn, "hourly"):
+            print("No archived forecasts to verify yet.")
+            return None
+        ensure_archive(conn) # archives with the older key are rebuilt here
+        with span("verify.load"):
+            pairs = load_pairs(conn, station, ARCHIVE_TARGETS, start, end)
+    finally:
+        conn.close()
+
+    scores = {}
+    with span("verify.score", rows=sum(len(p["forecast"]) for p in pairs.values())):
+        for target_var, p in pairs.items():
+            lead = (p["valid_time"] - p["run_time"]) // 3600
+            scores[target_var] = score(p["forecast"] - p["observed"], p["persistence"] - p["observed"],
+                                       lead, p["valid_time"], window_days)
+        if all(c in pairs and len(pairs[c]["forecast"]) for c in WIND_COMPONENTS):
+            err, reference_err, run_time, valid_time = _wind_errors(pairs)
+            scores["wdir"] = {"unit": "degrees", **score(err, reference_err, (valid_time - run_time) // 3600,
+                                                         valid_time, window_days)}
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "station": station,
+        "start": pd.Timestamp(start).isoformat() if start is not None else None,
+        "end": pd.Timestamp(end).isoformat() if end is not None else None,
+        "targets": scores,
+    }
+    _print_report(report)
+    if output is not None:
+        output = write_text_atomic(output, json.dumps(report, indent=2))
+        print(f"Saved verification report to {output}")
+    return report
+
+def _print_report(report):
+    print(f"Forecast verification for {report['station']}")
+    print(f"  {'target':<9} {'n':>8} {'MAE':>9} {'RMSE':>9} {'bias':>9} {'skill':>7}")
+    fmt = lambda v, w=9: f"{v:{w}.4f}" if v is not None else f"{'-':>{w}}"
+    for target_var, s in report["targets"].items():
+        if not s.get("n"):
+            print(f"  {target_var:<9} {0:>8}")
+            continue
+        print(f"  {target_var:<9} {s['n']:>8} {fmt(s['mae'])} {fmt(s['rmse'])} {fmt(s['bias'])} {fmt(s['skill'], 7)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score archived forecasts against observations.")
+    parser.add_argument("--days", type=int, help="only forecasts valid in the last N days")
+    parser.add_argument("--window-days", type=int, default=WINDOW_DAYS, help="window of the rolling scores")
+    parser.add_argument("--station", default=DEFAULT_STATION.id)
+    parser.add_argument("--output", default=VERIFICATION_PATH)
+    args = parser.parse_args()
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=args.days) if args.days else None
+    verify(args.station, start=start, window_days=args.window_days, output=args.output)